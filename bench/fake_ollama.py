@@ -0,0 +1,161 @@
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+import numpy as np
+from core.lexical_index import tokenize
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Hashed bag of words: deterministic, and texts sharing words land close together."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in tokenize(text):
+        h = zlib.crc32(token.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if not norm:
+        vector[zlib.crc32(text.encode("utf-8")) % dim] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+def fake_completion(prompt: str, tokens: int) -> List[str]:
+    """Words drawn from the prompt, seeded by the prompt, so replies repeat exactly."""
+    rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+    words = tokenize(prompt) or ["ok"]
+    return [rng.choice(words) + " " for _ in range(tokens)]
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """The subset of the Ollama API the brain uses: /api/embed, /api/chat, /api/generate."""
+    server: "FakeOllamaServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: Dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path in ("/", "/api/tags"):
+            self._send_json({"models": [{"name": m, "model": m} for m in ("llama3:latest", "nomic-embed-text:latest")]})
+        else:
+            self.send_error(404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        settings = self.server
+        if self.path in ("/api/embed", "/api/embeddings"):
+            texts = request.get("input", request.get("prompt", ""))
+            texts = [texts] if isinstance(texts, str) else texts
+            settings.count("embed_requests")
+            settings.count("embed_inputs", len(texts))
+            time.sleep(settings.embed_latency + settings.embed_item_latency * len(texts))
+            vectors = [fake_embedding(t, settings.dim) for t in texts]
+            if self.path == "/api/embeddings":
+                self._send_json({"embedding": vectors[0]})
+            else:
+                self._send_json({"model": request.get("model"), "embeddings": vectors})
+        elif self.path in ("/api/chat", "/api/generate"):
+            settings.count("completions")
+            if self.path == "/api/chat":
+                prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+            else:
+                prompt = request.get("prompt", "")
+            self._complete(request, prompt)
+        else:
+            self.send_error(404)
+
+    def _complete(self, request: Dict, prompt: str):
+        settings = self.server
+        chat = self.path == "/api/chat"
+        time.sleep(settings.first_token_latency)
+        tokens = fake_completion(prompt, settings.completion_tokens)
+
+        def event(text: str, done: bool) -> Dict:
+            payload = {"model": request.get("model"), "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            if done:
+                payload.update(done_reason="stop", prompt_eval_count=len(prompt) // 4, eval_count=len(tokens))
+            return payload
+
+        if not request.get("stream", True):
+            time.sleep(settings.token_latency * len(tokens))
+            self._send_json(event("".join(tokens), True))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(settings.token_latency)
+            self.wfile.write(json.dumps(event(token, False)).encode("utf-8") + b"\n")
+        self.wfile.write(json.dumps(event("", True)).encode("utf-8") + b"\n")
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Stand-in Ollama with deterministic output and configurable latency, for benchmarks."""
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = 768,
+                 embed_latency: float = 0.0, embed_item_latency: float = 0.0,
+                 first_token_latency: float = 0.0, token_latency: float = 0.0,
+                 completion_tokens: int = 32):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_item_latency = embed_item_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.completion_tokens = completion_tokens
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def take_counters(self) -> Dict[str, int]:
+        with self._lock:
+            counters, self.counters = self.counters, {}
+        return counters
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve a deterministic fake Ollama API.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeOllamaServer(port=args.port, dim=args.dim, embed_latency=args.embed_latency,
+                              token_latency=args.token_latency)
+    print(f"Fake Ollama on {server.url}")
+    server.serve_forever()
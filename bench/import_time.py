@@ -0,0 +1,83 @@
+"""Import-time regression check for the CLI.
+
+    python -m bench.import_time                  # fails if a heavy dependency loads eagerly
+    python -m bench.import_time --budget-ms 400  # ...or if startup gets slower than this
+
+Each scenario runs in a fresh interpreter (best of --repeat runs) with
+`-X importtime`, so results don't depend on what this process has loaded.
+Run from the repository root.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# Only the code paths that need these may import them
+HEAVY = [
+    "chromadb", "langchain_chroma", "langchain_ollama", "ollama", "langchain_community",
+    "langchain_text_splitters", "langchain_core.retrievers", "duckduckgo_search", "streamlit",
+]
+
+SCENARIOS = {
+    # Startup of every command, and all of `--help`
+    "cli_help": [sys.executable, "-X", "importtime", "main.py", "--help"],
+    # What a no-op `index` or a server-backed `ask` loads before doing any work
+    "core_modules": [sys.executable, "-X", "importtime", "-c",
+                     "import main, core.database, core.ollama_client, core.server, core.watcher, core.ingestion"],
+}
+
+def run_once(command: List[str]) -> Dict:
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return {"wall_ms": wall * 1000, "modules": modules}
+
+def check(repeat: int = 5, budget_ms: float = None) -> Dict:
+    report = {}
+    for name, command in SCENARIOS.items():
+        runs = [run_once(command) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["wall_ms"])
+        heavy = sorted(m for m in best["modules"] if m in HEAVY)
+        slowest = sorted(best["modules"].items(), key=lambda item: item[1], reverse=True)[:5]
+        report[name] = {
+            "wall_ms": round(best["wall_ms"], 1),
+            "modules": len(best["modules"]),
+            "heavy_imports": heavy,
+            "slowest_imports_ms": {m: round(us / 1000, 1) for m, us in slowest},
+            "ok": not heavy and (budget_ms is None or best["wall_ms"] <= budget_ms),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if a scenario's best run is slower")
+    parser.add_argument("--out", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    report = check(args.repeat, args.budget_ms)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    for name, result in report.items():
+        if result["heavy_imports"]:
+            print(f"FAIL {name}: imported {', '.join(result['heavy_imports'])} at startup", file=sys.stderr)
+        elif not result["ok"]:
+            print(f"FAIL {name}: {result['wall_ms']}ms is over the {args.budget_ms}ms budget", file=sys.stderr)
+    sys.exit(0 if all(r["ok"] for r in report.values()) else 1)
+
+if __name__ == "__main__":
+    main()
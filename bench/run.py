@@ -0,0 +1,250 @@
+"""Reproducible benchmarks against a synthetic vault and a fake Ollama server.
+
+    python -m bench.run --notes 500 --out bench.json
+    python -m bench.run --notes 500 --compare bench.json --fail-over 20
+
+Run from the repository root (config.yaml is read from the working directory).
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+import numpy as np
+from bench.fake_ollama import FakeOllamaServer
+from bench.vault import generate_vault, sample_queries, stopword_queries
+
+STRATEGIES = ["simple", "hybrid", "hyde", "multi_query"]
+
+class PeakRSS:
+    """Highest resident set size seen while the block runs, sampled from /proc."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # No /proc (macOS): lifetime peak is the best available
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+    @property
+    def mb(self) -> float:
+        return round(self.peak / 2**20, 1)
+
+def measure(fn: Callable, server: FakeOllamaServer) -> Dict:
+    server.take_counters()
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        extra = fn()
+        seconds = time.perf_counter() - start
+    return {"seconds": round(seconds, 4), "peak_rss_mb": rss.mb, **server.take_counters(),
+            **(extra if isinstance(extra, dict) else {})}
+
+def latency_stats(samples: List[float]) -> Dict:
+    ms = np.array(samples) * 1000
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+    }
+
+def git_revision() -> Dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def apply_overrides(cfg, overrides: List[str]):
+    """`section.key=value` pairs; values are parsed as YAML scalars."""
+    import yaml
+    for item in overrides:
+        path, value = item.split("=", 1)
+        section, key = path.split(".", 1)
+        cfg.config.setdefault(section, {})[key] = yaml.safe_load(value)
+
+def run(args) -> Dict:
+    # Chroma may still hold files open at the end, so cleanup errors are not fatal
+    with tempfile.TemporaryDirectory(prefix="obsidian-brain-bench-", ignore_cleanup_errors=True) as workdir:
+        return run_in(args, Path(workdir))
+
+def run_in(args, workdir: Path) -> Dict:
+    vault = workdir / "vault"
+    generate_vault(vault, notes=args.notes, words_per_note=args.note_words,
+                   links_per_note=args.links, seed=args.seed)
+
+    server = FakeOllamaServer(dim=args.dim, embed_latency=args.embed_latency,
+                              embed_item_latency=args.embed_item_latency,
+                              first_token_latency=args.first_token_latency,
+                              token_latency=args.token_latency).start()
+    os.environ["OBSIDIAN_VAULT_PATH"] = str(vault)
+    os.environ["CHROMA_DB_PATH"] = str(workdir / "chroma")
+    os.environ["OLLAMA_BASE_URL"] = server.url
+    os.environ["EMBEDDING_CACHE_PATH"] = str(workdir / "embeddings.sqlite")
+
+    from core.config_loader import ConfigLoader
+    from core.ollama_client import OllamaClient
+    from core.database import DatabaseManager
+    from core.brain import Brain
+
+    cfg = ConfigLoader()
+    # Measure the work itself, not cache hits or the network
+    cfg.config['retrieval']['web_fallback'] = False
+    cfg.config.setdefault('result_cache', {})['enabled'] = False
+    apply_overrides(cfg, args.set)
+
+    results: Dict[str, Dict] = {}
+    db = DatabaseManager(cfg, OllamaClient(cfg))
+    results["cold_index"] = measure(db.index_vault, server)
+    results["cold_index"]["chunks"] = len(db.lexical_index)
+    results["noop_reindex"] = measure(db.index_vault, server)
+
+    edited = vault / "area_0" / "note_00000.md"
+    with open(edited, "a", encoding="utf-8") as f:
+        f.write("\n## Edited\nA fresh paragraph about docker volumes written during the benchmark.\n")
+    results["single_edit"] = measure(db.index_vault, server)
+
+    brain = Brain(cfg)
+    brain.retrieve("warm up", strategy="simple")  # Lazy indexes and connections
+    for salt, strategy in enumerate(STRATEGIES):
+        # Fresh questions per strategy so none rides on another's cached query embeddings
+        queries = sample_queries(args.queries, seed=args.seed, salt=salt)
+        samples = []
+
+        def queries_for(strategy=strategy):
+            for query in queries:
+                start = time.perf_counter()
+                brain.retrieve(query, strategy=strategy)
+                samples.append(time.perf_counter() - start)
+        results[f"query_{strategy}"] = measure(queries_for, server)
+        results[f"query_{strategy}"].update(latency_stats(samples))
+
+    # BM25 alone, on questions whose stopwords have posting lists as long as the index
+    lexical = []
+
+    def lexical_stopwords():
+        for query in stopword_queries(args.queries, seed=args.seed):
+            start = time.perf_counter()
+            db.lexical_index.search(query, k=cfg.get('retrieval', 'top_k', 5))
+            lexical.append(time.perf_counter() - start)
+    results["lexical_stopwords"] = measure(lexical_stopwords, server)
+    results["lexical_stopwords"].update(latency_stats(lexical))
+
+    first_token, total = [], []
+
+    def answers():
+        for query in sample_queries(args.answers, seed=args.seed, salt=len(STRATEGIES)):
+            start = time.perf_counter()
+            docs = brain.retrieve(query)
+            for i, _ in enumerate(brain.stream_answer(query, docs)):
+                if i == 0:
+                    first_token.append(time.perf_counter() - start)
+            total.append(time.perf_counter() - start)
+    results["answer"] = measure(answers, server)
+    results["answer"].update({f"ttft_{k}": v for k, v in latency_stats(first_token).items() if k != "n"})
+    results["answer"].update(latency_stats(total))
+
+    server.stop()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "fail_over", "verbose")},
+        "scenarios": results,
+    }
+
+# Lower is better for these; everything else (counts) is reported but not judged
+JUDGED_SUFFIXES = ("seconds", "_ms", "_mb")
+
+def compare(old: Dict, new: Dict, fail_over: float = None) -> bool:
+    """Print per-metric change against a previous run; False if anything regressed past `fail_over` %."""
+    from rich.console import Console
+    from rich.table import Table
+    table = Table(title=f"vs {(old.get('git') or {}).get('commit', '?')[:10]}")
+    for column in ("scenario", "metric", "old", "new", "change"):
+        table.add_column(column)
+    ok = True
+    for scenario, metrics in new["scenarios"].items():
+        for metric, value in metrics.items():
+            before = old.get("scenarios", {}).get(scenario, {}).get(metric)
+            if not metric.endswith(JUDGED_SUFFIXES) or not before:
+                continue
+            change = (value - before) / before * 100
+            regressed = fail_over is not None and change > fail_over
+            ok = ok and not regressed
+            style = "red" if regressed else ("green" if change < 0 else "")
+            table.add_row(scenario, metric, str(before), str(value), f"[{style}]{change:+.1f}%[/{style}]" if style else f"{change:+.1f}%")
+    Console().print(table)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--note-words", type=int, default=400)
+    parser.add_argument("--links", type=float, default=3.0, help="Average wikilinks per note")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", type=int, default=50, help="Queries per strategy")
+    parser.add_argument("--answers", type=int, default=10, help="End-to-end answers to time")
+    parser.add_argument("--dim", type=int, default=768, help="Fake embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per embed request")
+    parser.add_argument("--embed-item-latency", type=float, default=0.0, help="Extra seconds per embedded text")
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE",
+                        help="Override a config.yaml value for this run")
+    parser.add_argument("--out", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--fail-over", type=float, default=None, help="Exit 1 if a timing/RSS metric grows more than this %%")
+    parser.add_argument("--verbose", action="store_true", help="Keep the brain's own logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        import logging
+        from utils.logger import console
+        console.quiet = True
+        logging.getLogger().setLevel(logging.WARNING)
+
+    report = run(args)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        ok = compare(json.loads(Path(args.compare).read_text()), report, args.fail_over)
+        sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
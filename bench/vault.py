@@ -0,0 +1,76 @@
+import random
+from pathlib import Path
+from typing import List
+
+TOPICS = [
+    "docker", "kubernetes", "python", "asyncio", "postgres", "sqlite", "rust", "linux",
+    "networking", "cooking", "gardening", "finance", "running", "philosophy", "history", "music",
+]
+# Function words, so common terms have posting lists as long as in real prose
+FILLER = ["the", "a", "and", "of", "to", "in", "is", "it", "for", "with", "what", "how", "do", "i", "my", "on", "that", "this"]
+
+def vocabulary(size: int, rng: random.Random) -> List[str]:
+    syllables = ["ka", "lo", "mi", "ne", "ru", "ta", "vi", "so", "pe", "da", "zu", "fo"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def pick_word(rng: random.Random, topic: str, words: List[str]) -> str:
+    draw = rng.random()
+    return topic if draw < 0.15 else rng.choice(FILLER) if draw < 0.45 else rng.choice(words)
+
+def note_name(i: int) -> str:
+    return f"note_{i:05d}"
+
+def generate_vault(root, notes: int = 500, words_per_note: int = 400, links_per_note: float = 3.0,
+                   folders: int = 8, seed: int = 42) -> List[Path]:
+    """Write a deterministic synthetic vault; the same arguments always give the same bytes.
+
+    Each note has a topic whose words recur in its sections (so queries have
+    real answers) and on average `links_per_note` [[wikilinks]] to other notes.
+    """
+    rng = random.Random(seed)
+    words = vocabulary(2000, rng)
+    root = Path(root)
+    paths = []
+    for i in range(notes):
+        topic = TOPICS[i % len(TOPICS)]
+        folder = root / f"area_{i % folders}" if folders else root
+        folder.mkdir(parents=True, exist_ok=True)
+        n_links = int(links_per_note) + (rng.random() < links_per_note % 1)
+        links = [f"[[{note_name(rng.randrange(notes))}]]" for _ in range(n_links)]
+
+        body, written = [f"# {topic.title()} note {i}\n"], 0
+        while written < words_per_note:
+            body.append(f"\n## Section {len(body)}\n")
+            paragraph = [pick_word(rng, topic, words) for _ in range(60)]
+            if links and rng.random() < 0.5:
+                paragraph.insert(rng.randrange(len(paragraph)), links.pop())
+            body.append(" ".join(paragraph) + "\n")
+            written += len(paragraph)
+        if links:
+            body.append("\nRelated: " + " ".join(links) + "\n")
+
+        path = folder / f"{note_name(i)}.md"
+        path.write_text("".join(body), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+def sample_queries(count: int, seed: int = 42, salt: int = 0) -> List[str]:
+    """Questions mixing topics with vault words; a different `salt` gives a disjoint-ish set."""
+    words = vocabulary(2000, random.Random(seed))
+    rng = random.Random(seed * 1000 + salt)
+    return [
+        f"what do my notes say about {rng.choice(TOPICS)} {rng.choice(words)} and {rng.choice(words)}"
+        for _ in range(count)
+    ]
+
+def stopword_queries(count: int, seed: int = 42) -> List[str]:
+    """Natural-language questions where most terms occur in nearly every chunk."""
+    words = vocabulary(2000, random.Random(seed))
+    rng = random.Random(seed * 1000 - 1)
+    return [
+        f"how do i use {rng.choice(TOPICS)} with the {rng.choice(words)} and what is it for in my notes on this"
+        for _ in range(count)
+    ]
@@ -0,0 +1,225 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Set
+import numpy as np
+from langchain_core.documents import Document
+from core.brain import Brain
+from core.filters import QueryFilter
+from utils.logger import logger, log_brain, log_step
+from utils.tracing import capture
+
+class BatchQuestion(NamedTuple):
+    id: str
+    question: str
+    strategy: Optional[str] = None
+    where: Optional[QueryFilter] = None
+    vaults: Optional[List[str]] = None
+    error: Optional[str] = None  # Set when the input line itself is unusable
+
+def read_questions(path, brain: Brain) -> Iterator[BatchQuestion]:
+    """Questions from a JSONL file: one `{"id"?, "question", "strategy"?, "filter"?, "vaults"?}` per line.
+
+    A line may also be a bare JSON string. Lines without an "id" are numbered
+    from 1. Unusable lines come back with `error` set, under their own "id"
+    when it could be read, so they are reported rather than silently dropped.
+    """
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            qid = str(number)
+            try:
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {"question": item}
+                qid = str(item.get("id", number))
+                question = item.get("question") or item.get("query")
+                if not question:
+                    raise ValueError("no 'question'")
+                where = QueryFilter.from_dict(item.get("filter"))
+                vaults = item.get("vaults") or None
+                brain.shards.select(vaults)
+                yield BatchQuestion(qid, question, item.get("strategy"), where, vaults)
+            except (ValueError, AttributeError) as e:
+                yield BatchQuestion(qid, line.strip()[:200], error=f"line {number}: {e}")
+
+def load_checkpoint(path) -> Set[str]:
+    """IDs already answered in `path`.
+
+    Failed records and a line cut short by a crash are dropped from the file,
+    so their questions are simply asked again.
+    """
+    path = Path(path)
+    if not path.exists():
+        return set()
+    kept, done = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "id" in record and not record.get("error"):
+                kept.append(line if line.endswith("\n") else line + "\n")
+                done.add(str(record["id"]))
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text("".join(kept), encoding="utf-8")
+    tmp.replace(path)
+    return done
+
+def percentiles(samples: Sequence[float]) -> Dict:
+    if not samples:
+        return {"n": 0}
+    ms = np.array(samples) * 1000
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+    }
+
+def stage_ms(spans: List[Dict]) -> Dict[str, float]:
+    """Milliseconds per span name (summed when a stage ran several times)."""
+    stages: Dict[str, float] = {}
+    for event in spans:
+        stages[event["name"]] = round(stages.get(event["name"], 0.0) + event["ms"], 3)
+    return stages
+
+def sources_of(docs: List[Document]) -> List[Dict]:
+    sources, seen = [], set()
+    for doc in docs:
+        entry = {k: doc.metadata[k] for k in ("source", "filename", "heading") if doc.metadata.get(k)}
+        key = json.dumps(entry, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            sources.append(entry)
+    return sources
+
+class BatchRunner:
+    """Answers a file of questions with retrieval pipelined ahead of generation.
+
+    Up to `retrieval_workers` questions are retrieved while answers stream
+    from the LLM, and at most `prefetch` retrieved questions wait for a
+    generation slot. Every Ollama request of the run (embeddings, HyDE,
+    rewrites, CRAG grading and generation) takes a slot of the client's gate,
+    so no more than `concurrency` are in flight at once. Each record is
+    appended and flushed the moment its answer completes (in completion
+    order), which makes the output file its own checkpoint: with `resume`,
+    answered IDs are skipped.
+    """
+
+    def __init__(self, brain: Brain, concurrency: int = 2, retrieval_workers: int = 2, prefetch: int = 4,
+                 strategy: str = None):
+        self.brain = brain
+        self.concurrency = max(1, concurrency)
+        self.retrieval_workers = max(1, retrieval_workers)
+        self.prefetch = max(0, prefetch)
+        self.strategy = strategy
+        brain.ollama.gate.limit(self.concurrency)
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        self._counts = {"answered": 0, "failed": 0, "tokens": 0}
+
+    def run(self, questions: Iterator[BatchQuestion], out_path, resume: bool = False) -> Dict:
+        done = load_checkpoint(out_path) if resume else set()
+        if done:
+            log_step(f"Resuming: {len(done)} questions already answered.")
+        window = self.retrieval_workers + self.prefetch + self.concurrency
+        slots = threading.BoundedSemaphore(window)
+        started, skipped = time.perf_counter(), 0
+
+        with open(out_path, "a" if resume else "w", encoding="utf-8") as out, \
+                ThreadPoolExecutor(self.retrieval_workers, thread_name_prefix="batch-retrieve") as retrieve_pool, \
+                ThreadPoolExecutor(self.concurrency, thread_name_prefix="batch-generate") as generate_pool:
+            for question in questions:
+                if question.id in done:
+                    skipped += 1
+                    continue
+                if question.error:
+                    self._write(out, {"id": question.id, "question": question.question, "error": question.error})
+                    continue
+                slots.acquire()
+                retrieve_pool.submit(self._retrieve, question, generate_pool, out, slots)
+            # Every question holds a slot until its record is written
+            for _ in range(window):
+                slots.acquire()
+
+        wall = time.perf_counter() - started
+        summary = {
+            **self._counts,
+            "skipped": skipped,
+            "wall_seconds": round(wall, 3),
+            "questions_per_second": round(self._counts["answered"] / wall, 3) if wall else 0.0,
+            "tokens_per_second": round(self._counts["tokens"] / wall, 1) if wall else 0.0,
+            "latency": {stage: percentiles(self._samples.get(stage, []))
+                        for stage in ("total", "retrieve", "wait", "first_token", "generate")},
+        }
+        log_brain(f"Answered {summary['answered']} questions ({summary['failed']} failed, {skipped} skipped) "
+                  f"in {wall:.1f}s: {summary['questions_per_second']:.2f} q/s.")
+        return summary
+
+    def _retrieve(self, question: BatchQuestion, generate_pool, out, slots):
+        started = time.perf_counter()
+        try:
+            with capture() as spans:
+                docs = self.brain.retrieve(question.question, strategy=question.strategy or self.strategy,
+                                           where=question.where, vaults=question.vaults)
+        except Exception as e:
+            self._fail(out, slots, question, e, {"retrieve_ms": round((time.perf_counter() - started) * 1000, 3)})
+            return
+        retrieved = time.perf_counter()
+        generate_pool.submit(self._answer, question, docs, spans, started, retrieved, out, slots)
+
+    def _answer(self, question: BatchQuestion, docs: List[Document], spans: List[Dict],
+                started: float, retrieved: float, out, slots):
+        begun = time.perf_counter()
+        timings = {"retrieve_ms": round((retrieved - started) * 1000, 3), "wait_ms": round((begun - retrieved) * 1000, 3)}
+        try:
+            parts, first = [], None
+            with capture() as generation:
+                for token in self.brain.stream_answer(question.question, docs):
+                    if first is None:
+                        first = time.perf_counter()
+                    parts.append(token)
+        except Exception as e:
+            self._fail(out, slots, question, e, timings)
+            return
+        finished = time.perf_counter()
+        timings.update(
+            first_token_ms=round(((first or finished) - begun) * 1000, 3),
+            generate_ms=round((finished - begun) * 1000, 3),
+            total_ms=round((finished - started) * 1000, 3),
+            stages=stage_ms(spans + generation),
+        )
+        try:
+            self._write(out, {"id": question.id, "question": question.question, "answer": "".join(parts),
+                              "sources": sources_of(docs), "timings": timings})
+            with self._lock:
+                self._counts["answered"] += 1
+                self._counts["tokens"] += len(parts)
+                for stage, value in (("total", finished - started), ("retrieve", retrieved - started),
+                                     ("wait", begun - retrieved), ("first_token", (first or finished) - begun),
+                                     ("generate", finished - begun)):
+                    self._samples.setdefault(stage, []).append(value)
+        finally:
+            slots.release()
+
+    def _fail(self, out, slots, question: BatchQuestion, error: Exception, timings: Dict):
+        logger.error(f"Question {question.id} failed: {error}")
+        try:
+            self._write(out, {"id": question.id, "question": question.question, "error": str(error) or type(error).__name__,
+                              "timings": timings})
+        finally:
+            slots.release()
+
+    def _write(self, out, record: Dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if record.get("error"):
+                self._counts["failed"] += 1
+            out.write(line)
+            out.flush()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import time
+from typing import Iterator, List, Optional, Sequence
+from langchain_core.documents import Document
+from core.config_loader import ConfigLoader
+from core.ollama_client import OllamaClient
+from core.shards import ShardSet
+from core.retrieval_engine import RetrievalEngine
+from core.document_parser import doc_to_dict
+from core.context_builder import ContextBuilder
+from core.filters import QueryFilter
+from core.result_cache import normalize_query
+from utils.logger import log_brain
+from utils.tracing import record, span
+
+PROMPT_TEMPLATE = "Answer strictly using this Context:\n{context}\n\nQuestion: {question}"
+
+class Brain:
+    """The full question-answering stack, built once and reused across questions."""
+
+    def __init__(self, config: ConfigLoader):
+        self.config = config
+        self.ollama = OllamaClient(config)
+        self.shards = ShardSet(config, self.ollama)
+        self.engine = RetrievalEngine(config, self.shards, self.ollama)
+        self.llm = self.ollama.get_llm()
+        self.context = ContextBuilder.for_model(config, self.ollama.llm_model)
+
+    def retrieve(self, query: str, strategy: str = None, where: Optional[QueryFilter] = None,
+                 vaults: Sequence[str] = None) -> List[Document]:
+        return self.engine.execute_retrieval(query, strategy=strategy, where=where, vaults=vaults)
+
+    def build_prompt(self, query: str, docs: List[Document]) -> str:
+        with span("context.build", chunks=len(docs)) as timing:
+            context, stats = self.context.build(docs)
+            timing.update(tokens=stats.tokens, tokens_saved=stats.tokens_saved)
+        log_brain(
+            f"Context: {stats.tokens} tokens from {stats.chunks} chunks in {stats.blocks} blocks "
+            f"(~{stats.tokens_saved} tokens saved, budget {self.context.max_tokens})."
+        )
+        return PROMPT_TEMPLATE.format(context=context, question=query)
+
+    def stream_answer(self, query: str, docs: List[Document]) -> Iterator[str]:
+        cache = self.engine.cache
+        if cache is None:
+            yield from self._generate(query, docs)
+            return
+
+        # Same model, same context and the same question give the same answer. The context is
+        # fingerprinted by content, so no index version is needed and no reindex evicts it
+        version = "0"
+        fingerprint = hashlib.sha1(
+            json.dumps([doc_to_dict(d) for d in docs], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        scope = f"{self.ollama.llm_model}|{fingerprint}"
+        key = f"{scope}|{normalize_query(query)}"
+        embedding = self.engine.query_embedding(query) if cache.semantic else None
+        cached = cache.get("answer", key, version, scope=scope, embedding=embedding)
+        if cached is not None:
+            log_brain("⚡ Answer cache hit.")
+            yield cached
+            return
+
+        parts = []
+        for token in self._generate(query, docs):
+            parts.append(token)
+            yield token
+        if parts:
+            cache.put("answer", key, version, "".join(parts), scope=scope, embedding=embedding)
+
+    def _generate(self, query: str, docs: List[Document]) -> Iterator[str]:
+        prompt = self.build_prompt(query, docs)
+        with span("llm.generate", prompt_chars=len(prompt)) as timing:
+            started, tokens = time.perf_counter(), 0
+            for chunk in self.llm.stream(prompt):
+                if chunk.content:
+                    if not tokens:
+                        record("llm.first_token", time.perf_counter() - started)
+                    tokens += 1
+                    timing["tokens"] = tokens
+                    yield chunk.content
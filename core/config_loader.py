@@ -22,8 +22,10 @@ class ConfigLoader:
         cfg['system']['vault_path'] = os.getenv("OBSIDIAN_VAULT_PATH", "./vault")
         cfg['system']['ollama_url'] = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         cfg['system']['chroma_path'] = os.getenv("CHROMA_DB_PATH", "./chroma_db")
+        if os.getenv("EMBEDDING_CACHE_PATH"):
+            cfg.setdefault('cache', {})['embedding_cache_path'] = os.getenv("EMBEDDING_CACHE_PATH")
         return cfg
 
-    def get(self, section, key=None):
-        if key: return self.config.get(section, {}).get(key)
+    def get(self, section, key=None, default=None):
+        if key: return self.config.get(section, {}).get(key, default)
         return self.config.get(section, {})
\ No newline at end of file
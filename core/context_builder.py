@@ -0,0 +1,116 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from langchain_core.documents import Document
+from core.document_parser import doc_key
+
+class ContextStats(NamedTuple):
+    tokens: int
+    tokens_saved: int
+    chunks: int
+    blocks: int
+
+def chunk_position(doc: Document) -> Optional[int]:
+    """Position of a chunk within its note: its `chunk` metadata, else the `<hash>-<i>` suffix of older IDs."""
+    if isinstance(doc.metadata.get("chunk"), int):
+        return doc.metadata["chunk"]
+    try:
+        return int((doc.id or "").rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+def overlap(left: str, right: str, limit: int, min_chars: int = 16) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    for size in range(min(limit, len(left), len(right)), min_chars - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+class ContextBuilder:
+    """Packs retrieved chunks into a prompt context under a token budget.
+
+    Chunks of the same note are stitched back together where the splitter's
+    overlap (or plain adjacency) connects them, duplicate and contained spans
+    are dropped, and the resulting blocks are added in retrieval order until
+    the budget is spent. Tokens are estimated from characters, since Ollama
+    exposes no tokenizer.
+    """
+
+    def __init__(self, max_tokens: int = 3000, chars_per_token: float = 4.0, max_overlap: int = 400):
+        self.max_tokens = max_tokens
+        self.chars_per_token = chars_per_token
+        self.max_overlap = max_overlap
+
+    @classmethod
+    def for_model(cls, config, llm_model: str) -> "ContextBuilder":
+        """Budget from `context.model_budgets` (longest matching model prefix), else `max_tokens`."""
+        cfg = config.get('context') or {}
+        budgets: Dict[str, int] = cfg.get('model_budgets') or {}
+        matches = [name for name in budgets if llm_model.startswith(name)]
+        budget = budgets[max(matches, key=len)] if matches else cfg.get('max_tokens', 3000)
+        return cls(
+            max_tokens=budget,
+            chars_per_token=cfg.get('chars_per_token', 4.0),
+            max_overlap=2 * config.get('system', 'chunk_overlap', 200)
+        )
+
+    def count(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token + 0.5)
+
+    def _merge(self, ranked: List[Tuple[int, Document]]) -> List[Tuple[int, str]]:
+        """Join one note's chunks (in note order) into as few contiguous spans as possible.
+
+        Each span keeps the best retrieval rank of the chunks it absorbed.
+        """
+        spans: List[List] = []
+        previous = None
+        for rank, doc in ranked:
+            text = doc.page_content.strip()
+            position = chunk_position(doc)
+            if spans and text in spans[-1][1]:
+                spans[-1][0] = min(spans[-1][0], rank)
+                continue
+            shared = overlap(spans[-1][1], text, self.max_overlap) if spans else 0
+            if shared:
+                spans[-1][1] += text[shared:]
+            elif spans and position is not None and previous is not None and position == previous + 1:
+                spans[-1][1] += "\n" + text
+            else:
+                spans.append([rank, text])
+                previous = position
+                continue
+            spans[-1][0] = min(spans[-1][0], rank)
+            previous = position
+        return [tuple(span) for span in spans]
+
+    def build(self, docs: List[Document]) -> Tuple[str, ContextStats]:
+        """Context string for `docs` (given in relevance order) plus what packing it saved."""
+        seen = set()
+        by_source: Dict[str, List[Tuple[int, Document]]] = {}
+        for rank, doc in enumerate(docs):
+            key = doc_key(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            by_source.setdefault(doc.metadata.get("source") or key, []).append((rank, doc))
+
+        blocks: List[Tuple[int, str]] = []
+        for ranked in by_source.values():
+            ranked.sort(key=lambda item: (chunk_position(item[1]) is None, chunk_position(item[1]) or 0))
+            blocks.extend(self._merge(ranked))
+        blocks.sort(key=lambda block: block[0])
+
+        packed, used = [], 0
+        for _, block in blocks:
+            cost = self.count(block) + 1
+            if used + cost > self.max_tokens:
+                if packed:
+                    continue
+                # Never send an empty context because the best block alone is too long
+                block = block[:int(self.max_tokens * self.chars_per_token)]
+                cost = self.count(block)
+            packed.append(block)
+            used += cost
+
+        context = "\n\n".join(packed)
+        naive = self.count("\n\n".join(d.page_content for d in docs))
+        stats = ContextStats(self.count(context), max(0, naive - self.count(context)), len(docs), len(packed))
+        return context, stats
@@ -0,0 +1,87 @@
+import re
+from typing import Callable, List, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from core.lexical_index import tokenize
+from utils.logger import logger, log_brain
+
+GRADE_PROMPT = """You are grading search results for relevance to a question.
+
+Question: {question}
+
+{excerpts}
+
+For every excerpt, reply with one line "<excerpt number>: <score>", where the score
+is 0 (useless) to 10 (answers the question). No other text."""
+GRADE_LINE = re.compile(r"^\W*(\d+)\W*[:=\-]\s*(\d+(?:\.\d+)?)\s*(?:/\s*10)?\W*$")
+LLM_KEEP = 5  # Excerpt scores at or above this are kept
+
+class CorrectiveGrader:
+    """Cheap-first relevance grading of retrieved chunks (Corrective RAG).
+
+    Every chunk gets a vectorized score blending embedding similarity to the
+    question with lexical coverage of the question's terms. Clear passes and
+    clear failures are decided on that alone; only the borderline band goes to
+    the LLM, all of it in a single batched prompt.
+    """
+
+    def __init__(self, llm, embed_query: Callable, embed_documents: Callable,
+                 accept: float = 0.7, reject: float = 0.4, lexical_weight: float = 0.3,
+                 excerpt_chars: int = 600):
+        self.llm = llm
+        self.embed_query = embed_query
+        self.embed_documents = embed_documents
+        self.accept = accept
+        self.reject = reject
+        self.lexical_weight = lexical_weight
+        self.excerpt_chars = excerpt_chars
+
+    def scores(self, query: str, docs: List[Document]) -> np.ndarray:
+        # Chunk vectors come from the embedding cache, so this is normally no Ollama work
+        q = np.asarray(self.embed_query(query), dtype=np.float32)
+        m = np.asarray(self.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+        similarity = m @ q / (np.linalg.norm(m, axis=1) * np.linalg.norm(q) + 1e-12)
+
+        terms = set(tokenize(query))
+        coverage = np.array([
+            len(terms & set(tokenize(d.page_content))) / len(terms) if terms else 0.0 for d in docs
+        ], dtype=np.float32)
+        return (1 - self.lexical_weight) * similarity + self.lexical_weight * coverage
+
+    def grade(self, query: str, docs: List[Document]) -> Tuple[List[Document], List[Document]]:
+        """(kept, rejected best-first); the caller falls back on the rejected ones when nothing replaces them."""
+        if not docs:
+            return [], []
+        scores = self.scores(query, docs)
+        keep = scores >= self.accept
+        borderline = np.flatnonzero((scores >= self.reject) & ~keep)
+        if len(borderline):
+            for i in self._llm_grade(query, [docs[i] for i in borderline]):
+                keep[borderline[i]] = True
+        log_brain(
+            f"CRAG kept {int(keep.sum())}/{len(docs)} chunks "
+            f"({len(borderline)} borderline sent to the LLM in one call)."
+        )
+        rejected = [docs[i] for i in np.argsort(-scores, kind="stable") if not keep[i]]
+        return [doc for doc, ok in zip(docs, keep) if ok], rejected
+
+    def _llm_grade(self, query: str, docs: List[Document]) -> List[int]:
+        """Indexes (into docs) the LLM judged relevant; keeps everything if grading fails."""
+        excerpts = "\n\n".join(
+            f"[{i + 1}] {d.page_content[:self.excerpt_chars]}" for i, d in enumerate(docs)
+        )
+        try:
+            reply = self.llm.invoke(GRADE_PROMPT.format(question=query, excerpts=excerpts)).content
+        except Exception as e:
+            logger.warning(f"CRAG grading call failed, keeping borderline chunks: {e}")
+            return list(range(len(docs)))
+        # One score per excerpt line; anything else in the reply (numbers in prose) is ignored
+        graded = {}
+        for line in reply.splitlines():
+            match = GRADE_LINE.match(line.strip())
+            if match and 1 <= int(match.group(1)) <= len(docs):
+                graded.setdefault(int(match.group(1)) - 1, float(match.group(2)))
+        if not graded:
+            logger.warning("CRAG grading reply had no scores, keeping borderline chunks.")
+            return list(range(len(docs)))
+        return [i for i in range(len(docs)) if graded.get(i, 0) >= LLM_KEEP]
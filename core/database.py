@@ -1,61 +1,346 @@
-from langchain_chroma import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import hashlib
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import List, Optional
 from langchain_core.documents import Document  # <--- THIS WAS MISSING
 from core.config_loader import ConfigLoader
 from core.ollama_client import OllamaClient
-from core.document_parser import DocumentParser
+from core.document_parser import METADATA_VERSION, DocumentParser
+from core.markdown_chunker import CHUNKER_VERSION
+from core.filters import QueryFilter
+from core.lexical_index import LexicalIndex
+from core.manifest import FileRecord, VaultManifest
+from core.ingestion import IngestionPipeline
+from core.link_graph import LinkGraph
 from utils.logger import logger, log_step, log_brain
+from utils.tracing import span, timed_iter
 
 class DatabaseManager:
-    def __init__(self, config: ConfigLoader, ollama: OllamaClient):
-        self.persist_directory = config.get('system', 'chroma_path')
-        self.embedding_function = ollama.get_embeddings()
-        self.parser = DocumentParser(config.get('system', 'vault_path'))
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.get('system', 'chunk_size'),
-            chunk_overlap=config.get('system', 'chunk_overlap')
+    def __init__(self, config: ConfigLoader, ollama: OllamaClient, shard=None):
+        from core.shards import default_shard
+        shard = shard or default_shard(config)
+        self.name = shard.name
+        self.collection = shard.collection
+        self.persist_directory = shard.persist_directory
+        self.config = config
+        self.ollama = ollama
+        self._embeddings = self._vector_store = self._splitter = None
+        self._lock = threading.RLock()
+        self.parser = DocumentParser(
+            shard.vault_path,
+            workers=config.get('system', 'scan_workers', 0),
+            use_processes=config.get('system', 'scan_processes', False),
+            exclude=shard.exclude
         )
-        self.vector_store = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embedding_function,
-            collection_name="obsidian_vault"
+        # BM25 index lives next to the vector store so "Rebuild DB" wipes both together
+        self.lexical_index = LexicalIndex(Path(self.persist_directory) / "lexical_index.sqlite")
+        self.manifest = VaultManifest(Path(self.persist_directory) / "manifest.sqlite")
+        self.link_graph = LinkGraph(Path(self.persist_directory) / "link_graph")
+        self.ingestion = config.get('ingestion')
+
+    # The embedding model, the vector store and the splitter are heavy imports that a
+    # no-op reindex never touches, so each is created on first use.
+    @property
+    def embedding_function(self):
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = self.ollama.get_embeddings()
+            return self._embeddings
+
+    @property
+    def vector_store(self):
+        with self._lock:
+            if self._vector_store is None:
+                from core.vector_store import open_vector_store
+                self._vector_store = open_vector_store(
+                    self.config, self.persist_directory, self.embedding_function,
+                    collection=self.collection, catalog=self.lexical_index
+                )
+            return self._vector_store
+
+    @property
+    def vector_backend(self) -> str:
+        return (self.config.get('vector_store') or {}).get('backend', 'chroma')
+
+    @property
+    def splitter(self):
+        with self._lock:
+            if self._splitter is None:
+                if self.chunker == "markdown":
+                    from core.markdown_chunker import MarkdownChunker
+                    self._splitter = MarkdownChunker(
+                        chunk_size=self.config.get('system', 'chunk_size'),
+                        chunk_overlap=self.config.get('system', 'chunk_overlap')
+                    )
+                else:
+                    from langchain_text_splitters import RecursiveCharacterTextSplitter
+                    self._splitter = RecursiveCharacterTextSplitter(
+                        chunk_size=self.config.get('system', 'chunk_size'),
+                        chunk_overlap=self.config.get('system', 'chunk_overlap')
+                    )
+            return self._splitter
+
+    @property
+    def chunker(self) -> str:
+        return self.config.get('system', 'chunker', 'markdown')
+
+    def split(self, doc: Document) -> List[Document]:
+        """Chunks of one note, each with its ID set."""
+        if self.chunker == "markdown":
+            return self.splitter.split(doc)
+        splits = self.splitter.split_documents([doc])
+        for chunk_id, chunk in zip(self._chunk_ids(doc.metadata['source'], len(splits)), splits):
+            chunk.id = chunk_id
+        return splits
+
+    def index_vault(self, paths: List[Path] = None) -> int:
+        """Bring the index in line with the vault, or only with the given notes/folders."""
+        with span("index", scope="vault" if paths is None else "paths", vault=self.name) as timing:
+            timing["files"] = self._index_vault(paths)
+        return timing["files"]
+
+    def _index_vault(self, paths: List[Path] = None) -> int:
+        log_step("Starting incremental indexing..." if paths is None else f"Reindexing {len(paths)} changed paths...")
+        self.ensure_lexical_index()
+        self._adopt_legacy_chunks()
+        self.ensure_link_graph()
+        known = self.manifest.entries()
+        on_disk, stats = set(), {}
+        # A different chunker, chunk size or note metadata invalidates every stored chunk, so everything
+        # is re-split; chunks whose text is unchanged only get their metadata refreshed
+        chunker = f"{self.chunker}{CHUNKER_VERSION}" if self.chunker == "markdown" else self.chunker
+        chunking = (f"{chunker}:{self.config.get('system', 'chunk_size')}:"
+                    f"{self.config.get('system', 'chunk_overlap')}:meta{METADATA_VERSION}")
+        rechunk = bool(known) and self.manifest.get_meta('chunking') != chunking
+        if rechunk:
+            log_step(f"Chunking changed to {chunking}; re-splitting every note...")
+        # A new vector backend starts empty: every chunk is embedded into it again
+        migrate = bool(known) and self.manifest.get_meta('vector_backend', 'chroma') != self.vector_backend
+        if migrate:
+            log_step(f"Vector backend changed to {self.vector_backend}; re-embedding every note...")
+            rechunk = True
+        if paths is not None:
+            # Deletion detection is limited to the notes under the paths we were given
+            prefixes = tuple(str(p) for p in paths)
+            known = {k: r for k, r in known.items()
+                     if any(k == p or k.startswith(p + os.sep) for p in prefixes)}
+
+        def changed_paths():
+            # Cheap pass: only stat() every note; parsing starts while the walk continues
+            scan = self.parser.scan_vault() if paths is None else self.parser.scan_paths(paths)
+            for path, stat in timed_iter("index.walk", scan):
+                key = str(path)
+                if key in on_disk:
+                    continue
+                on_disk.add(key)
+                record = known.get(key)
+                if rechunk or record is None or record.mtime_ns != stat.st_mtime_ns or record.size != stat.st_size:
+                    stats[key] = stat
+                    yield path
+
+        touched, links, reused = [], {}, [0, 0]
+
+        def new_documents():
+            for doc in self.parser.iter_documents(changed_paths()):
+                source = doc.metadata['source']
+                stat, record = stats.pop(source), known.get(source)
+                # Touched files whose content hash is unchanged only need their stat refreshed
+                if record and record.hash == doc.metadata['hash'] and not rechunk:
+                    touched.append(record._replace(mtime_ns=stat.st_mtime_ns, size=stat.st_size))
+                else:
+                    yield doc, stat
+
+        def prepare(item):
+            doc, stat = item
+            source = doc.metadata['source']
+            splits = self.split(doc)
+            links[source] = [l for l in doc.metadata['links'].split(',') if l]
+            record = FileRecord(source, stat.st_mtime_ns, stat.st_size, doc.metadata['hash'], [d.id for d in splits])
+            # Content-derived IDs: a chunk that is already stored only needs its metadata refreshed.
+            # Recursive chunk IDs are positional, so an unchanged ID says nothing about the text.
+            reusable = source in known and not migrate and self.chunker == "markdown"
+            old = set(known[source].chunk_ids) if reusable else set()
+            kept = [d for d in splits if d.id in old]
+            if kept:
+                self._refresh_metadata(kept)
+            reused[0] += len(kept)
+            reused[1] += len(splits)
+            return record, [d for d in splits if d.id not in old]
+
+        pipeline = IngestionPipeline(
+            embed_fn=lambda texts: self.embedding_function.embed_documents(texts),
+            write_fn=self._write_batch,
+            on_files_done=lambda records: self._replace_records(records, known, links),
+            batch_size=self.ingestion.get('batch_size', 64),
+            concurrency=self.ingestion.get('embed_concurrency', 2),
+            queue_depth=self.ingestion.get('queue_depth', 4),
+            max_retries=self.ingestion.get('max_retries', 3),
         )
+        processed = pipeline.run(new_documents(), prepare)
+        if touched:
+            self.manifest.put_many(touched)
+        if reused[0]:
+            log_brain(f"Kept {reused[0]} of {reused[1]} chunks of edited notes unchanged (not re-embedded).")
+        if paths is None and not pipeline.failed and (rechunk or not known):
+            self.manifest.set_meta('chunking', chunking)
+            self.manifest.set_meta('vector_backend', self.vector_backend)
+
+        deleted = [p for p in known if p not in on_disk]
+        if deleted:
+            self._purge_files([known[p] for p in deleted])
+            log_brain(f"Removed {len(deleted)} deleted notes from the index.")
+        if migrate and paths is None and not pipeline.failed:
+            # A backend used before may still hold chunks of notes deleted since
+            live = {cid for r in self.manifest.entries().values() for cid in r.chunk_ids}
+            orphans = [d.id for d in self.vector_store.get(include_documents=False) if d.id not in live]
+            if orphans:
+                self.vector_store.delete(orphans)
+                log_brain(f"Dropped {len(orphans)} stale chunks left in the {self.vector_backend} store.")
 
-    def index_vault(self):
-        log_step("Starting incremental indexing...")
-        disk_docs = self.parser.load_vault()
-        
-        # Fetch existing hashes to avoid re-embedding
-        existing_data = self.vector_store.get()
-        existing_hashes = set()
-        if existing_data and 'metadatas' in existing_data:
-            for meta in existing_data['metadatas']:
-                if meta and 'hash' in meta: existing_hashes.add(meta['hash'])
-        
-        new_docs = [d for d in disk_docs if d.metadata['hash'] not in existing_hashes]
-        
-        if not new_docs:
+        if self.link_graph.stale:
+            # Here rather than at query time, so no question waits for the adjacency to be resolved
+            with span("index.link_graph"):
+                self.link_graph.rebuild()
+        if not processed and not deleted:
             log_step("✨ No changes detected. Database up to date.")
+            return 0
+        self.manifest.set_meta('index_version', self.index_version + 1)
+        log_step(f"✅ Indexing complete ({processed} new/modified documents).")
+        if hasattr(self._embeddings, 'hits'):
+            log_brain(f"Embedding cache: {self.embedding_function.hits} hits, {self.embedding_function.misses} misses.")
+        return processed
+
+    @property
+    def index_version(self) -> int:
+        """Bumped whenever an indexing run changes anything."""
+        return self.manifest.get_meta('index_version', 0)
+
+    @property
+    def cache_version(self) -> str:
+        """`index_version` qualified by a random ID made with the manifest.
+
+        A rebuilt shard starts counting from 0 again; the new ID keeps its
+        versions from matching results cached against the old index.
+        """
+        with self._lock:
+            epoch = self.manifest.get_meta('index_epoch')
+            if epoch is None:
+                epoch = uuid.uuid4().hex[:12]
+                self.manifest.set_meta('index_epoch', epoch)
+        return f"{epoch}.{self.index_version}"
+
+    def _write_batch(self, ids: List[str], docs: List[Document], embeddings: List[List[float]]):
+        with span("store.vector_upsert", chunks=len(ids), backend=self.vector_backend):
+            self.vector_store.upsert(ids, embeddings, [d.page_content for d in docs], [d.metadata for d in docs])
+        with span("store.lexical_add", chunks=len(ids)):
+            self.lexical_index.add(ids, docs)
+
+    def _refresh_metadata(self, docs: List[Document]):
+        """Update stored chunks whose text is unchanged but whose metadata moved (position, tags...)."""
+        stored = self.lexical_index.metadata([d.id for d in docs])
+        changed = [d for d in docs if stored.get(d.id) != d.metadata]
+        if not changed:
             return
+        with span("store.metadata_refresh", chunks=len(changed)):
+            self.vector_store.update_metadata([d.id for d in changed], [d.metadata for d in changed])
+            self.lexical_index.add([d.id for d in changed], changed)
 
-        log_step(f"⚡ Processing {len(new_docs)} new/modified documents...")
-        splits = self.splitter.split_documents(new_docs)
-        
-        if splits:
-            batch_size = 100
-            for i in range(0, len(splits), batch_size):
-                self.vector_store.add_documents(splits[i:i+batch_size])
-                log_brain(f"Indexed batch {i//batch_size + 1}")
-            
-        log_step("✅ Indexing complete.")
-
-    def get_retriever(self, k=5):
-        return self.vector_store.as_retriever(search_kwargs={"k": k})
-        
-    def get_all_documents(self):
-        """Helper for BM25 (fetch all docs text)."""
-        # This function caused the error because Document wasn't imported
-        data = self.vector_store.get() 
-        if not data['documents']:
+    @staticmethod
+    def _chunk_ids(source: str, count: int) -> List[str]:
+        prefix = hashlib.md5(source.encode('utf-8')).hexdigest()[:16]
+        return [f"{prefix}-{i}" for i in range(count)]
+
+    def _replace_records(self, records: List[FileRecord], known, links):
+        """Commit new manifest records and drop chunks the new versions no longer have."""
+        stale = []
+        for record in records:
+            old = known.get(record.path)
+            if old:
+                stale.extend(set(old.chunk_ids) - set(record.chunk_ids))
+        self._delete_chunks(stale)
+        self.link_graph.set_links({r.path: links.pop(r.path, []) for r in records})
+        self.manifest.put_many(records)
+
+    def _purge_files(self, records: List[FileRecord]):
+        self._delete_chunks([cid for r in records for cid in r.chunk_ids])
+        self.link_graph.remove([r.path for r in records])
+        self.manifest.remove([r.path for r in records])
+
+    def _delete_chunks(self, chunk_ids: List[str]):
+        if not chunk_ids:
+            return
+        self.vector_store.delete(chunk_ids)
+        self.lexical_index.delete(chunk_ids)
+
+    def _adopt_legacy_chunks(self):
+        """Seed the manifest from chunks written before it existed.
+
+        Legacy records get an impossible stat so every note is re-hashed once;
+        notes whose hash still matches are kept, the rest replace their chunks.
+        """
+        if self.manifest.get_meta('adopted'):
+            return
+        if len(self.manifest) or not self.vector_store.count():
+            self.manifest.set_meta('adopted', True)
+            return
+        log_step("Adopting chunks from a pre-manifest index (one-time)...")
+        by_source = {}
+        for doc in self.vector_store.get(include_documents=False):
+            ids, hashes = by_source.setdefault(doc.metadata.get('source', ''), ([], set()))
+            ids.append(doc.id)
+            hashes.add(doc.metadata.get('hash', ''))
+        # A source with several hashes carries stale duplicates, so force a rewrite
+        self.manifest.put_many(
+            FileRecord(source, 0, -1, hashes.pop() if len(hashes) == 1 else '', ids)
+            for source, (ids, hashes) in by_source.items()
+        )
+        self.manifest.set_meta('adopted', True)
+
+    def ensure_lexical_index(self):
+        """One-time backfill of the BM25 index for databases built before it existed."""
+        if len(self.lexical_index) or not self.vector_store.count():
+            return
+        log_step("Building lexical index from existing vector store (one-time)...")
+        docs = self.get_all_documents()
+        self.lexical_index.add([d.id for d in docs], docs)
+        log_brain(f"Lexical index ready ({len(docs)} chunks).")
+
+    def ensure_link_graph(self):
+        """One-time backfill of the link graph from the links metadata of stored chunks."""
+        if len(self.link_graph) or not len(self.manifest):
+            return
+        log_step("Building link graph from existing index (one-time)...")
+        chunks = self.lexical_index.first_chunks(list(self.manifest.entries()))
+        self.link_graph.set_links({
+            d.metadata['source']: [l for l in d.metadata.get('links', '').split(',') if l] for d in chunks
+        })
+
+    def linked_documents(self, query: str, docs: List[Document], depth=1, max_notes=3, decay=0.5,
+                         where: Optional[QueryFilter] = None) -> List[Document]:
+        """Best-matching chunk of each note within `depth` wikilink hops of the retrieved ones (and in scope)."""
+        with span("retrieve.link_graph"):
+            neighbours = dict(self.link_graph.expand(
+                {d.metadata.get('source') for d in docs}, depth=depth, max_notes=max_notes, decay=decay
+            ))
+            if where is not None and where.active and neighbours:
+                in_scope = set(self.lexical_index.sources(where))
+                neighbours = {s: w for s, w in neighbours.items() if s in in_scope}
+        if not neighbours:
             return []
-        return [Document(page_content=t, metadata=m) for t, m in zip(data['documents'], data['metadatas'])]
\ No newline at end of file
+        best = {}
+        for doc, _ in self.lexical_index.search(query, k=len(neighbours) * 4, sources=neighbours):
+            best.setdefault(doc.metadata['source'], doc)
+        for doc in self.lexical_index.first_chunks([s for s in neighbours if s not in best]):
+            best[doc.metadata['source']] = doc
+        ranked = sorted(best, key=neighbours.get, reverse=True)
+        return [
+            Document(id=best[s].id, page_content=best[s].page_content,
+                     metadata={**best[s].metadata, 'link_score': neighbours[s]})
+            for s in ranked
+        ]
+
+    def get_all_documents(self):
+        """Fetch every stored chunk (full collection scan, avoid on the query path)."""
+        return self.vector_store.get()
\ No newline at end of file
@@ -1,42 +1,160 @@
+import os
 import re
 import hashlib
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple
 from langchain_core.documents import Document
+from core.markdown_chunker import frontmatter_tags, split_frontmatter
 from utils.logger import logger
+from utils.tracing import record
+
+# Bump when parse-time metadata changes so stored chunks get it on the next index run
+METADATA_VERSION = 2
+INLINE_TAG = re.compile(r'(?<![\w/#&])#([\w/-]*[^\W\d][\w/-]*)')
+CODE = re.compile(r'```.*?```|~~~.*?~~~|`[^`\n]*`', re.DOTALL)
+
+def doc_to_dict(doc: Document) -> Dict:
+    """JSON-safe form of a chunk, used by the server and the result cache."""
+    return {"id": doc.id, "page_content": doc.page_content, "metadata": doc.metadata}
+
+def doc_from_dict(data: Dict) -> Document:
+    return Document(id=data.get("id"), page_content=data["page_content"], metadata=data.get("metadata", {}))
+
+def doc_key(doc: Document) -> str:
+    """Stable identity of a chunk: its ID, or the content hash for ad-hoc docs (web results)."""
+    return doc.id or hashlib.sha1(doc.page_content.encode('utf-8')).hexdigest()
 
 class DocumentParser:
-    def __init__(self, vault_path: str):
+    def __init__(self, vault_path: str, workers: int = 0, use_processes: bool = False, exclude: Iterable[str] = ()):
         self.vault_path = Path(vault_path)
+        # Folders indexed as separate shards
+        self.exclude = {os.path.abspath(p) for p in exclude}
         self.wikilink_pattern = re.compile(r'\[\[(.*?)\]\]')
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.use_processes = use_processes
 
-    def calculate_file_hash(self, file_path: Path) -> str:
-        """MD5 hash for change detection."""
-        hasher = hashlib.md5()
-        with open(file_path, 'rb') as f:
-            hasher.update(f.read())
-        return hasher.hexdigest()
-
-    def parse_file(self, file_path: Path) -> List[Document]:
+    def parse_file(self, file_path: Path, timing: Dict = None) -> List[Document]:
+        """One note as a document; `timing` gets the seconds spent reading and hashing it and its size."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            # Read once: the same bytes are decoded for content and hashed for change detection
+            started = time.perf_counter()
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+            digest = hashlib.md5(raw).hexdigest()
+            if timing is not None:
+                timing.update(seconds=time.perf_counter() - started, bytes=len(raw))
+            content = raw.decode('utf-8')
             
             # Simple Metadata & Link Extraction
             links = [l.split('|')[0] for l in self.wikilink_pattern.findall(content)]
             metadata = {
                 "source": str(file_path),
                 "filename": file_path.name,
-                "hash": self.calculate_file_hash(file_path),
-                "links": ",".join(links) # Store as string for Chroma compatibility
+                "hash": digest,
+                "links": ",".join(links), # Store as string for Chroma compatibility
+                "folder": self.folder_of(file_path),
+                "tags": ",".join(self.extract_tags(content)),
+                "mtime": int(mtime),
             }
             return [Document(page_content=content, metadata=metadata)]
         except Exception as e:
             logger.warning(f"Failed to parse {file_path.name}: {e}")
             return []
 
-    def load_vault(self) -> List[Document]:
-        docs = []
-        for file_path in self.vault_path.rglob("*.md"):
-            docs.extend(self.parse_file(file_path))
-        return docs
\ No newline at end of file
+    def folder_of(self, path: Path) -> str:
+        """Vault-relative folder of a note ("" at the root), always with forward slashes."""
+        try:
+            folder = path.parent.relative_to(self.vault_path).as_posix()
+        except ValueError:
+            return ""
+        return "" if folder == "." else folder
+
+    @staticmethod
+    def extract_tags(content: str) -> List[str]:
+        """Frontmatter and inline #tags, lowercased; tags inside code don't count."""
+        frontmatter, body = split_frontmatter(content)
+        tags = frontmatter_tags(frontmatter) + INLINE_TAG.findall(CODE.sub(" ", body))
+        return sorted({t.lower().strip("/") for t in tags if t.strip("/")})
+
+    def in_vault(self, path: Path) -> bool:
+        """Inside the vault, outside nested shards and outside any dot-folder (.obsidian, .trash, .git)."""
+        try:
+            parts = path.relative_to(self.vault_path).parts
+        except ValueError:
+            return False
+        if self.exclude and any(os.path.abspath(p) in self.exclude for p in [path, *path.parents]):
+            return False
+        return not any(p.startswith('.') for p in parts)
+
+    def is_note(self, path: Path) -> bool:
+        return path.suffix == '.md' and self.in_vault(path)
+
+    def scan_paths(self, paths: Iterable[Path]) -> Iterator[Tuple[Path, os.stat_result]]:
+        """Like scan_vault, but only for the given notes and folders; missing paths are skipped."""
+        for path in paths:
+            if path.is_dir():
+                if self.in_vault(path):
+                    yield from self.scan_vault(path)
+            elif self.is_note(path):
+                try:
+                    yield path, path.stat()
+                except OSError:
+                    continue
+
+    def scan_vault(self, root: Path = None) -> Iterator[Tuple[Path, os.stat_result]]:
+        """Walk the vault yielding (path, stat) for every note without reading it."""
+        stack = [str(root or self.vault_path)]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError as e:
+                logger.warning(f"Cannot scan {e.filename}: {e}")
+                continue
+            with entries:
+                for entry in entries:
+                    # Skip Obsidian's config, trash and VCS folders
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.abspath(entry.path) not in self.exclude:
+                            stack.append(entry.path)
+                    elif entry.name.endswith('.md'):
+                        try:
+                            yield Path(entry.path), entry.stat()
+                        except OSError:
+                            continue
+
+    def iter_documents(self, paths: Iterable[Path] = None) -> Iterator[Document]:
+        """Parse notes on a worker pool, yielding documents as soon as each one is ready.
+
+        At most a few files per worker are in flight, so a huge vault never sits
+        in memory at once and consumers can start chunking before the walk ends.
+        """
+        if paths is None:
+            paths = (path for path, _ in self.scan_vault())
+        pool_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        max_in_flight = self.workers * 4
+        with pool_cls(max_workers=self.workers) as pool:
+            in_flight = deque()
+            for path in paths:
+                in_flight.append(pool.submit(_parse_path, self.vault_path, path))
+                if len(in_flight) >= max_in_flight:
+                    yield from _timed(in_flight.popleft().result())
+            while in_flight:
+                yield from _timed(in_flight.popleft().result())
+
+def _parse_path(vault_path: Path, file_path: Path) -> Tuple[List[Document], Dict]:
+    # Module-level so it can be pickled into a process pool
+    timing = {}
+    return DocumentParser(vault_path, workers=1).parse_file(file_path, timing), timing
+
+def _timed(result: Tuple[List[Document], Dict]) -> List[Document]:
+    # Reported here, in the parent, since spans opened inside a worker process never reach its tracer
+    docs, timing = result
+    if timing:
+        record("parse.read_hash", timing["seconds"], bytes=timing["bytes"])
+    return docs
\ No newline at end of file
@@ -0,0 +1,135 @@
+import hashlib
+import threading
+import time
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Sequence
+from langchain_core.embeddings import Embeddings
+from utils.sqlite import open_database, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    key TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, key)
+);
+CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_used);
+CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """Content-addressed store of embeddings keyed by (model, sha256(text)).
+
+    It lives outside chroma_path on purpose: renames, re-chunking, other vaults
+    and "Rebuild DB" all reuse vectors that were already paid for.
+    """
+
+    def __init__(self, path, max_mb: int = 2048):
+        self.path = Path(path).expanduser()
+        self.max_bytes = int(max_mb) * 1024 * 1024
+        self.conn = open_database(self.path)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    def get_many(self, model: str, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i+500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(part))})",
+                    (model, *part),
+                ).fetchall()
+                found.update((key, array('f', blob).tolist()) for key, blob in rows)
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, model, key) for key in found],
+                )
+            self._count(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock, transaction(self.conn):
+            for key, vector in items.items():
+                blob = array('f', vector).tobytes()
+                old = self.conn.execute(
+                    "SELECT length(vector) FROM embeddings WHERE model = ? AND key = ?", (model, key)
+                ).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO embeddings(model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (model, key, blob, now),
+                )
+                self._count(bytes=len(blob) - (old[0] if old else 0))
+            self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used vectors until the cache is back under its size bound."""
+        while self.stats().get('bytes', 0) > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT rowid, length(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            self.conn.executemany("DELETE FROM embeddings WHERE rowid = ?", [(r[0],) for r in rows])
+            self._count(bytes=-sum(r[1] for r in rows), evictions=len(rows))
+
+    def _count(self, **deltas):
+        self.conn.executemany(
+            "INSERT INTO stats(key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            [(k, v) for k, v in deltas.items() if v],
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Lifetime counters: hits, misses, evictions and stored bytes."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT key, value FROM stats").fetchall())
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(path: str, max_mb: int) -> EmbeddingCache:
+    # One connection per cache file per process, shared by every client
+    return EmbeddingCache(path, max_mb)
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model so identical texts are never sent to it twice."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+
+    def _embed(self, namespace: str, texts: List[str], embed_fn) -> List[List[float]]:
+        keys = [text_key(t) for t in texts]
+        vectors = self.cache.get_many(namespace, list(dict.fromkeys(keys)))
+        # Deduplicate misses so repeated chunks in one batch are embedded once
+        missing = {k: t for k, t in zip(keys, texts) if k not in vectors}
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            # Round through float32 so a hit returns exactly what the miss returned
+            fresh = {k: array('f', v).tolist() for k, v in zip(missing, embed_fn(list(missing.values())))}
+            self.cache.put_many(namespace, fresh)
+            vectors.update(fresh)
+        return [vectors[k] for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(self.model, texts, self.embeddings.embed_documents)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Several queries in one request (Ollama embeds queries and documents the same way)."""
+        return self._embed(f"{self.model}#query", texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        # Kept apart from documents in case the model embeds queries differently
+        return self._embed(f"{self.model}#query", [text], lambda t: [self.embeddings.embed_query(t[0])])[0]
@@ -0,0 +1,105 @@
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+RELATIVE = re.compile(r"^(\d+)\s*([dwmy])$")
+DAYS = {"d": 1, "w": 7, "m": 30, "y": 365}
+
+def parse_date(text) -> Optional[float]:
+    """Epoch seconds from `2026`, `2026-03`, `2026-03-14` or a relative `30d` / `2w` / `6m` / `1y`."""
+    if text is None or text == "":
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+    text = str(text).strip()
+    relative = RELATIVE.match(text)
+    if relative:
+        return time.time() - int(relative.group(1)) * DAYS[relative.group(2)] * 86400
+    for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{text}' (use YYYY, YYYY-MM, YYYY-MM-DD or e.g. 30d)")
+
+def normalize_folder(folder: str) -> str:
+    return folder.replace("\\", "/").strip().strip("/")
+
+def normalize_tag(tag: str) -> str:
+    return tag.strip().lstrip("#").lower()
+
+class QueryFilter(NamedTuple):
+    """Scope of a query: notes under any of `folders`, carrying any of `tags`, modified in [since, until).
+
+    Tags match nested tags too (`work` matches `#work/meeting`). The same
+    filter is applied as SQL over the `folder`, `tags` and `mtime` columns of
+    the lexical index and the NumPy store's sidecar.
+    """
+    folders: Tuple[str, ...] = ()
+    tags: Tuple[str, ...] = ()
+    since: Optional[float] = None
+    until: Optional[float] = None
+
+    @classmethod
+    def build(cls, folders: Iterable[str] = (), tags: Iterable[str] = (), since=None, until=None) -> "QueryFilter":
+        return cls(
+            tuple(sorted({normalize_folder(f) for f in folders or () if normalize_folder(f)})),
+            tuple(sorted({normalize_tag(t) for t in tags or () if normalize_tag(t)})),
+            parse_date(since), parse_date(until),
+        )
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["QueryFilter"]:
+        if not data:
+            return None
+        return cls.build(data.get("folders"), data.get("tags"), data.get("since"), data.get("until"))
+
+    def to_dict(self) -> Dict:
+        return {"folders": list(self.folders), "tags": list(self.tags), "since": self.since, "until": self.until}
+
+    @property
+    def active(self) -> bool:
+        return bool(self.folders or self.tags or self.since is not None or self.until is not None)
+
+    def key(self) -> str:
+        """Stable text form, used to keep cached results of different scopes apart."""
+        if not self.active:
+            return ""
+        return f"folders={','.join(self.folders)};tags={','.join(self.tags)};since={self.since};until={self.until}"
+
+    def describe(self) -> str:
+        parts = [f"in {', '.join(f + '/' for f in self.folders)}" if self.folders else "",
+                 f"tagged {', '.join('#' + t for t in self.tags)}" if self.tags else "",
+                 f"since {datetime.fromtimestamp(self.since):%Y-%m-%d}" if self.since is not None else "",
+                 f"before {datetime.fromtimestamp(self.until):%Y-%m-%d}" if self.until is not None else ""]
+        return " ".join(p for p in parts if p)
+
+    def sql(self, prefix: str = "") -> Tuple[str, List]:
+        """(" AND ..." clause, params) over `folder`, `tags` (",a,b," form) and `mtime` columns."""
+        clauses, params = [], []
+        if self.folders:
+            ors = []
+            for folder in self.folders:
+                ors.append(f"{prefix}folder = ? OR substr({prefix}folder, 1, ?) = ?")
+                params += [folder, len(folder) + 1, folder + "/"]
+            clauses.append("(" + " OR ".join(ors) + ")")
+        if self.tags:
+            ors = []
+            for tag in self.tags:
+                ors.append(f"{prefix}tags LIKE ? ESCAPE '\\' OR {prefix}tags LIKE ? ESCAPE '\\'")
+                escaped = tag.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                params += [f"%,{escaped},%", f"%,{escaped}/%"]
+            clauses.append("(" + " OR ".join(ors) + ")")
+        if self.since is not None:
+            clauses.append(f"{prefix}mtime >= ?")
+            params.append(self.since)
+        if self.until is not None:
+            clauses.append(f"{prefix}mtime < ?")
+            params.append(self.until)
+        return "".join(f" AND {c}" for c in clauses), params
+
+def filter_columns(metadata: Dict) -> Tuple[str, str, Optional[float]]:
+    """(folder, ",tag,tag,", mtime) of a chunk's metadata, as stored in the filter columns."""
+    tags = [t for t in (metadata.get("tags") or "").split(",") if t]
+    return metadata.get("folder", ""), f",{','.join(tags)}," if tags else "", metadata.get("mtime")
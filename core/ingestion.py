@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
+from langchain_core.documents import Document
+from core.manifest import FileRecord
+from utils.logger import logger, log_brain
+from utils.tracing import record
+
+class StageStats:
+    """Thread-safe per-stage counters used for the end-of-run throughput report."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, items: int, seconds: float, **attrs):
+        record(f"ingest.{stage}", seconds, items=items, **attrs)
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0, 0.0])
+            totals[0] += items
+            totals[1] += seconds
+
+    def report(self, wall: float):
+        for stage, (items, seconds) in self.stages.items():
+            rate = items / seconds if seconds else 0.0
+            log_brain(f"{stage:>6}: {items} items in {seconds:.2f}s busy ({rate:.1f}/s)")
+        log_brain(f"  wall: {wall:.2f}s")
+
+class IngestionPipeline:
+    """Split → embed → write with the three stages overlapping.
+
+    Splitting runs on the caller's thread, up to `concurrency` embedding
+    requests are in flight against Ollama, and a single writer thread stores
+    finished batches while the next ones embed. At most `queue_depth` batches
+    are buffered, so a slow stage throttles the ones feeding it.
+
+    A file is handed to `on_files_done` only after every one of its chunks has
+    been written; anything interrupted or failed is simply redone next run.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        write_fn: Callable[[List[str], List[Document], List[List[float]]], None],
+        on_files_done: Callable[[List[FileRecord]], None],
+        batch_size: int = 64,
+        concurrency: int = 2,
+        queue_depth: int = 4,
+        max_retries: int = 3,
+        retry_backoff: float = 1.0,
+    ):
+        self.embed_fn = embed_fn
+        self.write_fn = write_fn
+        self.on_files_done = on_files_done
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.stats = StageStats()
+        self.failed = set()
+
+    def run(self, items: Iterable, prepare: Callable[[object], Tuple[FileRecord, List[Document]]]) -> int:
+        """Ingest `items`, using `prepare` to turn each into a file record and the chunks (IDs set) to embed."""
+        started = time.perf_counter()
+        records: Dict[str, FileRecord] = {}
+        failed = self.failed = set()
+        slots = threading.BoundedSemaphore(self.queue_depth + self.concurrency)
+        ready = queue.Queue()
+        writer = threading.Thread(target=self._write_loop, args=(ready, slots, records, failed), daemon=True)
+        writer.start()
+
+        def submit(batch, closing):
+            slots.acquire()
+            texts = [chunk.page_content for _, _, chunk in batch]
+            ready.put((pool.submit(self._embed, texts) if batch else None, batch, closing))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                batch, closing = [], []
+                for item in items:
+                    t0 = time.perf_counter()
+                    record, chunks = prepare(item)
+                    self.stats.add("split", len(chunks), time.perf_counter() - t0, file=record.path)
+                    records[record.path] = record
+                    for chunk in chunks:
+                        batch.append((record.path, chunk.id, chunk))
+                        if len(batch) >= self.batch_size:
+                            submit(batch, closing)
+                            batch, closing = [], []
+                    # The file is complete once the batch holding its last chunk is written
+                    closing.append(record.path)
+                if batch or closing:
+                    submit(batch, closing)
+        finally:
+            ready.put(None)
+            writer.join()
+
+        if records:
+            self.stats.report(time.perf_counter() - started)
+        if failed:
+            logger.warning(f"{len(failed)} files failed to index and will be retried next run.")
+        return len(records) - len(failed)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            t0 = time.perf_counter()
+            try:
+                vectors = self.embed_fn(texts)
+                self.stats.add("embed", len(texts), time.perf_counter() - t0,
+                               chars=sum(map(len, texts)), retries=attempt)
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * 2 ** attempt
+                logger.warning(f"Embedding batch failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _write_loop(self, ready: queue.Queue, slots, records, failed):
+        batch_no = 0
+        while (item := ready.get()) is not None:
+            future, batch, closing = item
+            try:
+                if batch:
+                    vectors = future.result()
+                    t0 = time.perf_counter()
+                    self.write_fn([cid for _, cid, _ in batch], [chunk for _, _, chunk in batch], vectors)
+                    self.stats.add("write", len(batch), time.perf_counter() - t0)
+                    batch_no += 1
+                    log_brain(f"Indexed batch {batch_no}")
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} chunks failed: {e}")
+                failed.update(path for path, _, _ in batch)
+            finally:
+                slots.release()
+
+            done = [records[path] for path in closing if path not in failed]
+            if done:
+                try:
+                    self.on_files_done(done)
+                except Exception as e:
+                    logger.error(f"Failed to record {len(done)} indexed files: {e}")
+                    failed.update(r.path for r in done)
@@ -0,0 +1,264 @@
+import heapq
+import json
+import math
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Sequence, Set, Tuple
+from langchain_core.documents import Document
+from core.filters import QueryFilter, filter_columns
+from utils.sqlite import open_database, transaction
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    chunk_id TEXT UNIQUE NOT NULL,
+    source TEXT,
+    length INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    folder TEXT,
+    tags TEXT,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS docs_source ON docs(source);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc);
+CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+# Filter columns, added to indexes created before query scoping existed
+FILTER_COLUMNS = {"folder": "TEXT", "tags": "TEXT", "mtime": "REAL"}
+FILTER_INDEXES = """
+CREATE INDEX IF NOT EXISTS docs_folder ON docs(folder);
+CREATE INDEX IF NOT EXISTS docs_mtime ON docs(mtime);
+"""
+
+class LexicalIndex:
+    """Persistent BM25 inverted index, stored in SQLite next to the vector store.
+
+    Chunks are added and removed incrementally during indexing, so a query only
+    touches the posting lists of its own terms instead of the whole corpus.
+    """
+
+    def __init__(self, path, k1: float = 1.5, b: float = 0.75, max_df: float = 0.5):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        # Terms in more than this share of chunks only rank chunks that rarer query terms found
+        self.max_df = max_df
+        self._conn = None
+        self._lock = threading.RLock()
+        self._df: Dict[str, int] = {}  # Document frequency per term, dropped on every write
+
+    @property
+    def conn(self):
+        # Opened on first use so commands that never search don't pay for it
+        with self._lock:
+            if self._conn is None:
+                self._conn = open_database(self.path)
+                self._conn.executescript(SCHEMA)
+                columns = {row[1] for row in self._conn.execute("PRAGMA table_info(docs)")}
+                for column, kind in FILTER_COLUMNS.items():
+                    if column not in columns:
+                        self._conn.execute(f"ALTER TABLE docs ADD COLUMN {column} {kind}")
+                self._conn.executescript(FILTER_INDEXES)
+            return self._conn
+
+    def _stats(self) -> Tuple[int, int]:
+        rows = dict(self.conn.execute("SELECT key, value FROM stats").fetchall())
+        return rows.get("n_docs", 0), rows.get("total_length", 0)
+
+    def _bump_stats(self, n_docs: int, total_length: int):
+        for key, delta in (("n_docs", n_docs), ("total_length", total_length)):
+            self.conn.execute(
+                "INSERT INTO stats(key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (key, delta),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._stats()[0]
+
+    def _delete_locked(self, chunk_ids: Sequence[str]):
+        self._df.clear()
+        removed, removed_length = 0, 0
+        for chunk_id in chunk_ids:
+            row = self.conn.execute(
+                "SELECT id, length FROM docs WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+            if row is None:
+                continue
+            self.conn.execute("DELETE FROM postings WHERE doc = ?", (row[0],))
+            self.conn.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+            removed += 1
+            removed_length += row[1]
+        if removed:
+            self._bump_stats(-removed, -removed_length)
+
+    def add(self, chunk_ids: Sequence[str], documents: Sequence[Document]):
+        """Insert or replace chunks under the given IDs."""
+        with self._lock, transaction(self.conn):
+            self._delete_locked(chunk_ids)
+            total_length = 0
+            for chunk_id, doc in zip(chunk_ids, documents):
+                terms = Counter(tokenize(doc.page_content))
+                length = sum(terms.values())
+                cursor = self.conn.execute(
+                    "INSERT INTO docs(chunk_id, source, length, content, metadata, folder, tags, mtime) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (chunk_id, doc.metadata.get("source"), length, doc.page_content, json.dumps(doc.metadata),
+                     *filter_columns(doc.metadata)),
+                )
+                self.conn.executemany(
+                    "INSERT INTO postings(term, doc, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in terms.items()],
+                )
+                total_length += length
+            self._bump_stats(len(chunk_ids), total_length)
+
+    def delete(self, chunk_ids: Sequence[str]):
+        with self._lock, transaction(self.conn):
+            self._delete_locked(chunk_ids)
+
+    def _doc_freq(self, term: str) -> int:
+        if term not in self._df:
+            self._df[term] = self.conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+        return self._df[term]
+
+    def _postings(self, term: str, source_filter: str, source_params: Tuple, only: Optional[Set[int]] = None):
+        """(doc, tf, length) for a term, or just for the chunks in `only` when that is cheaper than the full list."""
+        query = "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc WHERE p.term = ?"
+        if only is None:
+            return self.conn.execute(query + source_filter, (term, *source_params)).fetchall()
+        if len(only) * 4 >= self._doc_freq(term):
+            # Point lookups cost several times a row of the sequential posting scan
+            return [row for row in self.conn.execute(query, (term,)) if row[0] in only]
+        docs, rows = list(only), []
+        for i in range(0, len(docs), 500):
+            batch = docs[i:i + 500]
+            rows += self.conn.execute(query + f" AND p.doc IN ({','.join('?' * len(batch))})", (term, *batch)).fetchall()
+        return rows
+
+    def search(
+        self, query: str, k: int = 5, sources: Optional[Collection[str]] = None, where: Optional[QueryFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        """Okapi BM25 over the posting lists of the query terms, optionally limited to some notes or a scope.
+
+        Terms are scored rarest first. Common terms ("the", "what", above
+        `max_df`) only add to chunks the rarer terms already found, and so does
+        every term once the terms left could not lift an unseen chunk above the
+        current k-th score (MaxScore), so their posting lists are not scanned.
+        """
+        terms = set(tokenize(query))
+        source_filter, source_params = "", ()
+        if sources is not None:
+            if not sources:
+                return []
+            source_params = tuple(sources)
+            source_filter = f" AND d.source IN ({','.join('?' * len(source_params))})"
+        if where is not None and where.active:
+            # Joined into every posting scan, so out-of-scope chunks are never scored
+            clause, params = where.sql("d.")
+            source_filter += clause
+            source_params += tuple(params)
+        with self._lock:
+            n_docs, total_length = self._stats()
+            if not terms or not n_docs:
+                return []
+            avgdl = total_length / n_docs
+            idf, common = {}, set()
+            for term in terms:
+                df = self._doc_freq(term)
+                if df:
+                    idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                if df > self.max_df * n_docs:
+                    common.add(term)
+            # A term adds at most idf * (k1 + 1) to any chunk's score
+            remaining = sum(idf.values()) * (self.k1 + 1)
+            scores: Dict[int, float] = {}
+            for term in sorted(idf, key=idf.get, reverse=True):
+                only = None
+                if len(scores) >= k:
+                    threshold = heapq.nlargest(k, scores.values())[-1]
+                    if remaining < threshold:
+                        # Chunks that can't reach the k-th score even with every term left aren't looked up either
+                        only = {doc for doc, score in scores.items() if score + remaining >= threshold}
+                if only is None and scores and term in common:
+                    only = set(scores)
+                postings = self._postings(term, source_filter, source_params, only)
+                remaining -= idf[term] * (self.k1 + 1)
+                for doc, tf, length in postings:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avgdl)
+                    scores[doc] = scores.get(doc, 0.0) + idf[term] * tf * (self.k1 + 1) / norm
+
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            results = []
+            for doc, score in top:
+                chunk_id, content, metadata = self.conn.execute(
+                    "SELECT chunk_id, content, metadata FROM docs WHERE id = ?", (doc,)
+                ).fetchone()
+                results.append((Document(id=chunk_id, page_content=content, metadata=json.loads(metadata)), score))
+            return results
+
+    def sources(self, where: QueryFilter) -> List[str]:
+        """Notes with at least one chunk in scope."""
+        clause, params = where.sql()
+        with self._lock:
+            return [s for s, in self.conn.execute(f"SELECT DISTINCT source FROM docs WHERE 1 = 1{clause}", params)]
+
+    def coverage(self, query: str) -> float:
+        """Share of the query's distinct terms that occur anywhere in the index (1.0 for no terms)."""
+        terms = set(tokenize(query))
+        if not terms:
+            return 1.0
+        with self._lock:
+            known = sum(1 for term in terms
+                        if self.conn.execute("SELECT 1 FROM postings WHERE term = ? LIMIT 1", (term,)).fetchone())
+        return known / len(terms)
+
+    def facets(self) -> Tuple[List[str], List[str]]:
+        """Every folder and tag in the index, for scope pickers."""
+        with self._lock:
+            folders = {"/".join(f.split("/")[:i + 1])  # Parents too, a scope covers subfolders
+                       for f, in self.conn.execute("SELECT DISTINCT folder FROM docs WHERE folder != ''")
+                       for i in range(f.count("/") + 1)}
+            tags = {t for row, in self.conn.execute("SELECT DISTINCT tags FROM docs WHERE tags != ''")
+                    for t in row.split(",") if t}
+        return sorted(folders), sorted(tags)
+
+    def metadata(self, chunk_ids: Sequence[str]) -> Dict[str, Dict]:
+        """Stored metadata of the given chunks that exist."""
+        if not chunk_ids:
+            return {}
+        params = tuple(chunk_ids)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT chunk_id, metadata FROM docs WHERE chunk_id IN ({','.join('?' * len(params))})", params
+            ).fetchall()
+        return {cid: json.loads(meta) for cid, meta in rows}
+
+    def first_chunks(self, sources: Collection[str]) -> List[Document]:
+        """The opening chunk of each given note."""
+        if not sources:
+            return []
+        params = tuple(sources)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT chunk_id, content, metadata FROM docs WHERE id IN "
+                f"(SELECT MIN(id) FROM docs WHERE source IN ({','.join('?' * len(params))}) GROUP BY source)",
+                params,
+            ).fetchall()
+        return [Document(id=cid, page_content=content, metadata=json.loads(meta)) for cid, content, meta in rows]
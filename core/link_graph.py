@@ -0,0 +1,165 @@
+import heapq
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+from utils.sqlite import open_database, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (source TEXT PRIMARY KEY, targets TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+def _note_key(path: str) -> str:
+    """Lower-cased path without the .md suffix, the form wikilinks resolve against."""
+    key = path.replace('\\', '/').lower()
+    return key[:-3] if key.endswith('.md') else key
+
+class LinkGraph:
+    """Wikilink graph of the vault.
+
+    Raw outgoing links are kept per note in SQLite and updated alongside the
+    vector store; every change bumps a version there. At the end of an indexing
+    run the links are resolved into an undirected CSR adjacency (`indptr`/
+    `indices` arrays) that queries memory-map, so expanding a note is a slice,
+    not a metadata scan, and queries never wait for a rebuild: until it lands
+    they read the previous graph.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.conn = open_database(self.directory.with_suffix('.sqlite'))
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self._graph = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+
+    def _meta(self, key: str) -> int:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump(self):
+        self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('version', ?)", (self._meta('version') + 1,))
+
+    def set_links(self, links: Dict[str, List[str]]):
+        with self._lock, transaction(self.conn):
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO links(source, targets) VALUES (?, ?)",
+                [(source, json.dumps(targets)) for source, targets in links.items()],
+            )
+            self._bump()
+
+    def remove(self, sources: Iterable[str]):
+        with self._lock, transaction(self.conn):
+            self.conn.executemany("DELETE FROM links WHERE source = ?", [(s,) for s in sources])
+            self._bump()
+
+    @property
+    def stale(self) -> bool:
+        with self._lock:
+            return self._meta('version') != self._meta('built')
+
+    def rebuild(self):
+        """Resolve raw links into the compact on-disk adjacency."""
+        with self._lock:
+            version = self._meta('version')
+            rows = self.conn.execute("SELECT source, targets FROM links").fetchall()
+        nodes = sorted(source for source, _ in rows)
+        node_ids = {source: i for i, source in enumerate(nodes)}
+
+        # Obsidian resolves [[Note]] by name and [[folder/Note]] by path suffix;
+        # shorter paths win ties, like the app's "shortest path" setting
+        resolve: Dict[str, int] = {}
+        for source in sorted(nodes, key=len):
+            parts = _note_key(source).split('/')
+            for i in range(len(parts)):
+                resolve.setdefault('/'.join(parts[i:]), node_ids[source])
+
+        # One JSON parse for every note's targets, and one resolution per distinct target
+        targets_of = json.loads("[" + ",".join(targets for _, targets in rows) + "]")
+        resolved: Dict[str, int] = {}
+        src, dst = [], []
+        for (source, _), targets in zip(rows, targets_of):
+            i = node_ids[source]
+            for target in targets:
+                if target not in resolved:
+                    resolved[target] = resolve.get(_note_key(target.split('#')[0].strip()), -1)
+                j = resolved[target]
+                if j >= 0 and j != i:
+                    src.append(i)
+                    dst.append(j)
+
+        # Both directions of every link, deduplicated and sorted as (row, column) keys
+        n = len(nodes)
+        src, dst = np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+        keys = np.sort(np.concatenate([src * n + dst, dst * n + src]))
+        keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])] if len(keys) else keys
+        indices = (keys % n).astype(np.int32) if n else np.zeros(0, dtype=np.int32)
+        counts = np.bincount(keys // n, minlength=n) if n else np.zeros(0, dtype=np.int64)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = f"tmp{os.getpid()}"  # A watcher and a server may rebuild at the same time
+        np.save(self.directory / f'indptr.{tmp}.npy', indptr)
+        np.save(self.directory / f'indices.{tmp}.npy', indices)
+        (self.directory / f'nodes.{tmp}.json').write_text(json.dumps(nodes))
+        # nodes.json is replaced last: readers treat its mtime as the graph version
+        os.replace(self.directory / f'indptr.{tmp}.npy', self.directory / 'indptr.npy')
+        os.replace(self.directory / f'indices.{tmp}.npy', self.directory / 'indices.npy')
+        os.replace(self.directory / f'nodes.{tmp}.json', self.directory / 'nodes.json')
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('built', ?)", (version,))
+            # Queries in this process (serve --watch) switch over without reading the files back
+            self._graph = (nodes, node_ids, indptr, indices)
+            self._loaded_mtime = (self.directory / 'nodes.json').stat().st_mtime_ns
+
+    def _load(self):
+        """Last built (nodes, node_ids, indptr, indices), reloaded when a rebuild replaced it."""
+        nodes_file = self.directory / 'nodes.json'
+        try:
+            mtime = nodes_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._loaded_mtime:
+                nodes = json.loads(nodes_file.read_text())
+                self._graph = (
+                    nodes,
+                    {source: i for i, source in enumerate(nodes)},
+                    np.load(self.directory / 'indptr.npy', mmap_mode='r'),
+                    np.load(self.directory / 'indices.npy', mmap_mode='r'),
+                )
+                self._loaded_mtime = mtime
+            return self._graph
+
+    def expand(
+        self, seeds: Iterable[str], depth: int = 1, max_notes: int = 3,
+        decay: float = 0.5, max_frontier: int = 256
+    ) -> List[Tuple[str, float]]:
+        """Notes within `depth` hops of the seeds, scored by sum of decay**hop over paths."""
+        graph = self._load() if depth >= 1 else None
+        if graph is None:
+            return []
+        nodes, node_ids, indptr, indices = graph
+        frontier = {node_ids[s] for s in seeds if s in node_ids}
+        seen = set(frontier)
+        scores: Dict[int, float] = {}
+        for hop in range(1, depth + 1):
+            reached = set()
+            for i in frontier:
+                for j in indices[indptr[i]:indptr[i + 1]].tolist():
+                    if j not in seen:
+                        scores[j] = scores.get(j, 0.0) + decay ** hop
+                        reached.add(j)
+            seen |= reached
+            # Hubs (MOCs, daily indexes) would explode the next hop; keep the best-scored
+            frontier = set(heapq.nlargest(max_frontier, reached, key=scores.get))
+        best = heapq.nlargest(max_notes, scores.items(), key=lambda item: item[1])
+        return [(nodes[j], score) for j, score in best]
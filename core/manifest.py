@@ -0,0 +1,72 @@
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from utils.sqlite import open_database, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    chunk_ids TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+class FileRecord(NamedTuple):
+    path: str
+    mtime_ns: int
+    size: int
+    hash: str
+    chunk_ids: List[str]
+
+class VaultManifest:
+    """Per-file record of what is currently stored in the vector store.
+
+    Lets `index_vault` skip unchanged notes with a `stat` call and remove the
+    exact chunks of edited or deleted notes by ID.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.conn = open_database(self.path)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def entries(self) -> Dict[str, FileRecord]:
+        with self._lock:
+            rows = self.conn.execute("SELECT path, mtime_ns, size, hash, chunk_ids FROM files").fetchall()
+        return {r[0]: FileRecord(r[0], r[1], r[2], r[3], json.loads(r[4])) for r in rows}
+
+    def get(self, path: str) -> Optional[FileRecord]:
+        with self._lock:
+            r = self.conn.execute(
+                "SELECT path, mtime_ns, size, hash, chunk_ids FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        return FileRecord(r[0], r[1], r[2], r[3], json.loads(r[4])) if r else None
+
+    def put_many(self, records: Iterable[FileRecord]):
+        with self._lock, transaction(self.conn):
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files(path, mtime_ns, size, hash, chunk_ids) VALUES (?, ?, ?, ?, ?)",
+                [(r.path, r.mtime_ns, r.size, r.hash, json.dumps(r.chunk_ids)) for r in records],
+            )
+
+    def remove(self, paths: Iterable[str]):
+        with self._lock, transaction(self.conn):
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, json.dumps(value)))
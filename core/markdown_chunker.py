@@ -0,0 +1,165 @@
+import hashlib
+import json
+import re
+from typing import Dict, List, Tuple
+import yaml
+from langchain_core.documents import Document
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE = re.compile(r"^\s*(`{3,}|~{3,})")
+CHUNKER_VERSION = 2  # Bump when the same note would split differently, so indexes re-split
+FRONTMATTER = re.compile(r"\A---\s*\n(.*?)\n(?:---|\.\.\.)\s*(?:\n|\Z)", re.DOTALL)
+
+def split_frontmatter(text: str) -> Tuple[Dict, str]:
+    """YAML frontmatter as a dict (empty if absent or invalid) and the body after it."""
+    match = FRONTMATTER.match(text)
+    if not match:
+        return {}, text
+    try:
+        data = yaml.safe_load(match.group(1))
+    except yaml.YAMLError:
+        return {}, text
+    return (data if isinstance(data, dict) else {}), text[match.end():]
+
+def frontmatter_tags(frontmatter: Dict) -> List[str]:
+    tags = frontmatter.get("tags") or frontmatter.get("tag") or []
+    if isinstance(tags, str):
+        tags = re.split(r"[,\s]+", tags)
+    return [str(t).lstrip("#") for t in tags if t]
+
+def closes(line: str, fence: str) -> bool:
+    """A closing fence repeats the opening character at least as many times, with nothing else on the line."""
+    stripped = line.strip()
+    return stripped.startswith(fence) and not stripped.strip(fence[0])
+
+def blocks(lines: List[str]) -> List[Tuple[str, str]]:
+    """Group section lines into ("code" | "table" | "text", text) blocks.
+
+    Code fences and tables are whole blocks so they are never split; text is
+    grouped into paragraphs on blank lines.
+    """
+    out, current, kind, fence = [], [], None, None
+
+    def flush():
+        nonlocal current, kind
+        if current and any(l.strip() for l in current):
+            out.append((kind or "text", "\n".join(current).strip("\n")))
+        current, kind = [], None
+
+    for line in lines:
+        if fence:
+            current.append(line)
+            if closes(line, fence):
+                fence = None
+                flush()
+            continue
+        opening = FENCE.match(line)
+        if opening:
+            flush()
+            fence, kind = opening.group(1), "code"
+            current.append(line)
+        elif line.lstrip().startswith("|"):
+            if kind != "table":
+                flush()
+                kind = "table"
+            current.append(line)
+        elif not line.strip():
+            flush()
+        else:
+            if kind == "table":
+                flush()
+            current.append(line)
+    flush()
+    return out
+
+class MarkdownChunker:
+    """Splits notes on their headings into chunks with stable, content-derived IDs.
+
+    Each chunk is one section (or a run of whole paragraphs of a long section)
+    and carries its heading path and the note's frontmatter as metadata. Code
+    blocks and tables are never cut. A chunk's ID is derived from the note, its
+    heading path and its text, so editing one section leaves every other
+    section's ID, and therefore its stored embedding, untouched.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._fallback: Dict[int, object] = {}
+
+    def _split_long(self, text: str, size: int) -> List[str]:
+        # A single paragraph longer than a chunk: fall back to character splitting
+        if size not in self._fallback:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self._fallback[size] = RecursiveCharacterTextSplitter(
+                chunk_size=size, chunk_overlap=min(self.chunk_overlap, size // 2)
+            )
+        return self._fallback[size].split_text(text)
+
+    def sections(self, body: str) -> List[Tuple[List[str], List[str]]]:
+        """(heading path, lines) per section; headings inside code fences don't count."""
+        result, path, lines, fence = [], [], [], None
+        for line in body.split("\n"):
+            opening = FENCE.match(line)
+            if fence:
+                if closes(line, fence):
+                    fence = None
+            elif opening:
+                fence = opening.group(1)
+            else:
+                heading = HEADING.match(line)
+                if heading:
+                    result.append((list(path), lines))
+                    level = len(heading.group(1))
+                    path = path[:level - 1] + [""] * max(0, level - 1 - len(path)) + [heading.group(2)]
+                    lines = []
+            lines.append(line)
+        result.append((path, lines))
+        return [(p, l) for p, l in result if any(x.strip() for x in l)]
+
+    def _pack(self, section_blocks: List[Tuple[str, str]], size: int) -> List[str]:
+        """Greedily join whole blocks into chunks of at most `size` characters."""
+        pieces: List[str] = []
+        for kind, text in section_blocks:
+            if kind == "text" and len(text) > size:
+                pieces.extend(self._split_long(text, size))
+            else:
+                pieces.append(text)
+        chunks, current = [], ""
+        for piece in pieces:
+            if current and len(current) + 2 + len(piece) > size:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def split(self, doc: Document) -> List[Document]:
+        source = doc.metadata.get("source", "")
+        frontmatter, body = split_frontmatter(doc.page_content)
+        base = dict(doc.metadata)
+        if frontmatter:
+            # Tags (frontmatter and inline) are already extracted by the parser
+            base["frontmatter"] = json.dumps(frontmatter, default=str, sort_keys=True)
+
+        prefix = hashlib.md5(source.encode("utf-8")).hexdigest()[:16]
+        chunks, seen = [], {}
+        for path, lines in self.sections(body):
+            heading = " > ".join(h for h in path if h)
+            # The heading line is a prefix of every chunk of its section, never a chunk (or block) of its own
+            title = lines[0].strip() if path and HEADING.match(lines[0]) else ""
+            body_lines = lines[1:] if title else lines
+            budget = max(self.chunk_size - len(title) - 2, self.chunk_size // 2) if title else self.chunk_size
+            for part, text in enumerate(self._pack(blocks(body_lines), budget)):
+                if title:
+                    text = f"{title}\n\n{text}"
+                content_hash = hashlib.md5(f"{heading}\n{text}".encode("utf-8")).hexdigest()
+                # Identical sections in one note (e.g. repeated templates) still need distinct IDs
+                n = seen.get(content_hash, 0)
+                seen[content_hash] = n + 1
+                chunk_id = f"{prefix}-{content_hash[:16]}" + (f"-{n}" if n else "")
+                metadata = {**base, "heading": heading, "chunk": len(chunks), "chunk_hash": content_hash}
+                chunks.append(Document(id=chunk_id, page_content=text, metadata=metadata))
+        return chunks
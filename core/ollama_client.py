@@ -1,14 +1,53 @@
-from langchain_ollama import ChatOllama, OllamaEmbeddings
+import threading
+from contextlib import contextmanager
 from core.config_loader import ConfigLoader
 
+class OllamaGate:
+    """Optional cap on requests in flight to Ollama, shared by every model one OllamaClient builds."""
+
+    def __init__(self):
+        self.semaphore = None  # Unlimited until `limit` is called
+        self._held = threading.local()
+
+    def limit(self, slots: int):
+        self.semaphore = threading.BoundedSemaphore(slots) if slots else None
+
+    @contextmanager
+    def slot(self):
+        # Re-entrant per thread: embed_query calls embed_documents, one request still takes one slot
+        semaphore = self.semaphore
+        if semaphore is None or getattr(self._held, "depth", 0):
+            yield
+            return
+        with semaphore:
+            self._held.depth = 1
+            try:
+                yield
+            finally:
+                self._held.depth = 0
+
 class OllamaClient:
     def __init__(self, config: ConfigLoader):
         self.base_url = config.get('system', 'ollama_url')
         self.llm_model = config.get('system', 'llm_model')
         self.embed_model_name = config.get('system', 'embed_model')
+        self.cache_config = config.get('cache')
+        self.gate = OllamaGate()
 
+    # langchain_ollama takes about a second to import, so only the paths that talk to a model pay for it
     def get_llm(self, temperature=0):
-        return ChatOllama(base_url=self.base_url, model=self.llm_model, temperature=temperature)
+        from core.ollama_models import GatedChatOllama
+        return GatedChatOllama(base_url=self.base_url, model=self.llm_model, temperature=temperature, gate=self.gate)
 
     def get_embeddings(self):
-        return OllamaEmbeddings(base_url=self.base_url, model=self.embed_model_name)
\ No newline at end of file
+        from core.ollama_models import GatedOllamaEmbeddings
+        from core.embedding_cache import CachedEmbeddings, get_embedding_cache
+        # Cache hits never reach Ollama, so only the underlying requests take a gate slot
+        embeddings = GatedOllamaEmbeddings(base_url=self.base_url, model=self.embed_model_name, gate=self.gate)
+        if not self.cache_config.get('embeddings', True):
+            return embeddings
+        cache = get_embedding_cache(
+            self.cache_config.get('embedding_cache_path', '~/.cache/obsidian-brain/embeddings.sqlite'),
+            self.cache_config.get('embedding_cache_max_mb', 2048)
+        )
+        return CachedEmbeddings(embeddings, cache, self.embed_model_name)
\ No newline at end of file
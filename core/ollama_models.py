@@ -0,0 +1,29 @@
+from typing import Any, Iterator, List
+from langchain_ollama import ChatOllama, OllamaEmbeddings
+from pydantic import Field
+
+# Imported only by OllamaClient.get_llm / get_embeddings, so langchain_ollama stays off the startup path
+
+class GatedChatOllama(ChatOllama):
+    """ChatOllama whose requests wait for a slot of the client's OllamaGate (held for a whole stream)."""
+    gate: Any = Field(default=None, exclude=True)
+
+    def _generate(self, *args, **kwargs):
+        with self.gate.slot():
+            return super()._generate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs) -> Iterator:
+        with self.gate.slot():
+            yield from super()._stream(*args, **kwargs)
+
+class GatedOllamaEmbeddings(OllamaEmbeddings):
+    """OllamaEmbeddings whose requests wait for a slot of the client's OllamaGate."""
+    gate: Any = Field(default=None, exclude=True)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.gate.slot():
+            return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.gate.slot():
+            return super().embed_query(text)
@@ -0,0 +1,99 @@
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+import numpy as np
+from utils.sqlite import open_database, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    layer TEXT NOT NULL,
+    key TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    version TEXT NOT NULL,
+    value TEXT NOT NULL,
+    embedding BLOB,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (layer, key)
+);
+CREATE INDEX IF NOT EXISTS entries_scope ON entries(layer, scope, version);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_used);
+"""
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation don't change what is being asked."""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+class ResultCache:
+    """Layered cache for retrieval results, HyDE passages and final answers.
+
+    Entries carry the index version they were computed against and are only
+    served while that version is current, so reindexing invalidates exactly
+    the results that could have changed. Within a layer and scope (e.g. the
+    same strategy and top_k) an optional semantic mode also serves entries
+    whose query embedding is close enough to the new one.
+    """
+
+    def __init__(self, path, max_entries: int = 5000, ttl: float = 86400,
+                 semantic: bool = False, semantic_threshold: float = 0.95):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        self.conn = open_database(self.path)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    def get(self, layer: str, key: str, version: str, scope: str = "",
+            embedding: Optional[List[float]] = None) -> Optional[Any]:
+        fresh_after = time.time() - self.ttl
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT key, value FROM entries WHERE layer = ? AND key = ? AND version = ? AND created >= ?",
+                (layer, key, version, fresh_after),
+            ).fetchone()
+            if row is None and self.semantic and embedding is not None:
+                row = self._nearest(layer, scope, version, fresh_after, embedding)
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE entries SET last_used = ? WHERE layer = ? AND key = ?", (time.time(), layer, row[0])
+            )
+        return json.loads(row[1])
+
+    def _nearest(self, layer, scope, version, fresh_after, embedding):
+        rows = self.conn.execute(
+            "SELECT key, value, embedding FROM entries WHERE layer = ? AND scope = ? AND version = ? "
+            "AND created >= ? AND embedding IS NOT NULL",
+            (layer, scope, version, fresh_after),
+        ).fetchall()
+        if not rows:
+            return None
+        matrix = np.stack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+        query = np.asarray(embedding, dtype=np.float32)
+        sims = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = int(np.argmax(sims))
+        return rows[best][:2] if sims[best] >= self.semantic_threshold else None
+
+    def put(self, layer: str, key: str, version: str, value: Any, scope: str = "",
+            embedding: Optional[List[float]] = None):
+        now = time.time()
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self._lock, transaction(self.conn):
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries(layer, key, scope, version, value, embedding, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (layer, key, scope, version, json.dumps(value), blob, now, now),
+            )
+            # Expired entries can never be served again
+            self.conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+            excess = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
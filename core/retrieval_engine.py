@@ -1,98 +1,312 @@
-from typing import List
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from pathlib import Path
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence
 from langchain_core.documents import Document
-from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-# Safely import BM25 (Community)
-try:
-    from langchain_community.retrievers import BM25Retriever
-except ImportError:
-    from langchain.retrievers import BM25Retriever
-
-from langchain_community.tools import DuckDuckGoSearchRun
 from core.config_loader import ConfigLoader
 from core.database import DatabaseManager
+from core.shards import ShardSet
 from core.ollama_client import OllamaClient
+from core.document_parser import doc_from_dict, doc_key, doc_to_dict
+from core.filters import QueryFilter
+from core.result_cache import ResultCache, normalize_query
+from core.crag import CorrectiveGrader
+from core.web_search import WebFallback
 from utils.logger import logger, log_step, log_brain
+from utils.tracing import propagate, span
 
-# --- CUSTOM ENSEMBLE RETRIEVER ---
-# This ensures it works regardless of LangChain version
-class SimpleEnsembleRetriever(BaseRetriever):
-    retrievers: List[BaseRetriever]
-    weights: List[float]
+# Shared by every concurrent retrieval call (vector and BM25 searches, query embeddings)
+_retriever_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="retriever")
 
-    def _get_relevant_documents(
-        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None
-    ) -> List[Document]:
-        all_docs = []
-        for i, retriever in enumerate(self.retrievers):
-            try:
-                docs = retriever.invoke(query)
-                all_docs.extend(docs)
-            except Exception as e:
-                logger.warning(f"Retriever {i} failed: {e}")
-        
-        # Deduplicate
-        unique_docs = []
-        seen_hashes = set()
-        for doc in all_docs:
-            doc_hash = hash(doc.page_content)
-            if doc_hash not in seen_hashes:
-                seen_hashes.add(doc_hash)
-                unique_docs.append(doc)
-        return unique_docs
-# ---------------------------------
+def _timed_call(name: str, call: Callable[[], List[Document]]) -> List[Document]:
+    with span(f"retriever.{name}") as timing:
+        docs = call()
+        timing["docs"] = len(docs)
+    return docs
+
+def gather_results(
+    calls: List[Callable[[], List[Document]]], timeout: float, names: List[str] = None
+) -> List[List[Document]]:
+    """Run retrieval calls concurrently; any that fail or miss the shared deadline return []."""
+    names = names or [str(i) for i in range(len(calls))]
+    futures = [_retriever_pool.submit(propagate(partial(_timed_call, n, c))) for n, c in zip(names, calls)]
+    deadline = time.monotonic() + timeout
+    results = []
+    for i, future in enumerate(futures):
+        try:
+            results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+        except FutureTimeout:
+            logger.warning(f"Retriever {names[i]} timed out after {timeout}s")
+            results.append([])
+        except Exception as e:
+            logger.warning(f"Retriever {names[i]} failed: {e}")
+            results.append([])
+    return results
+
+def reciprocal_rank_fusion(
+    results: List[List[Document]], weights: List[float], k: int, c: int = 60
+) -> List[Document]:
+    """Weighted RRF: score(d) = sum_i w_i / (c + rank_i(d)), keeping the top k."""
+    with span("retrieve.fusion", lists=len(results)):
+        scores, docs = {}, {}
+        for ranked, weight in zip(results, weights):
+            for rank, doc in enumerate(ranked, 1):
+                key = doc_key(doc)
+                docs.setdefault(key, doc)
+                scores[key] = scores.get(key, 0.0) + weight / (c + rank)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [docs[key] for key in best]
 
 class RetrievalEngine:
-    def __init__(self, config: ConfigLoader, db: DatabaseManager, ollama: OllamaClient):
+    def __init__(self, config: ConfigLoader, shards: ShardSet, ollama: OllamaClient):
         self.config = config
         self.llm = ollama.get_llm()
-        self.web_search = DuckDuckGoSearchRun()
-        self.vector_retriever = db.get_retriever(k=config.get('retrieval', 'top_k'))
-        self.db = db
+        self.shards = shards
+        self.web = None
+        if config.get('retrieval', 'web_fallback'):
+            self.web = WebFallback(config, Path(shards.persist_directory) / "web_cache.sqlite")
+        self.llm_model = ollama.llm_model
+        cache_cfg = config.get('result_cache')
+        self.cache = None
+        if cache_cfg.get('enabled', True):
+            self.cache = ResultCache(
+                Path(shards.persist_directory) / "result_cache.sqlite",
+                max_entries=cache_cfg.get('max_entries', 5000),
+                ttl=cache_cfg.get('ttl_seconds', 86400),
+                semantic=cache_cfg.get('semantic', False),
+                semantic_threshold=cache_cfg.get('semantic_threshold', 0.95)
+            )
+
+        self.grader = None
+        if config.get('features', 'use_crag'):
+            crag = config.get('crag') or {}
+            self.grader = CorrectiveGrader(
+                self.llm, self.query_embedding, shards.embedding_function.embed_documents,
+                accept=crag.get('accept', 0.7),
+                reject=crag.get('reject', 0.4),
+                lexical_weight=crag.get('lexical_weight', 0.3)
+            )
+
+    def query_embedding(self, query: str) -> List[float]:
+        with span("embed.query"):
+            return self.shards.embedding_function.embed_query(query)
+
+    def _embed_async(self, text: str) -> Callable[[], List[float]]:
+        # Submitted ahead of the searches that wait on it, so BM25 runs while the query is embedded
+        return _retriever_pool.submit(propagate(self.query_embedding), text).result
 
-    def hybrid_search(self, query: str) -> List[Document]:
+    def fan_out(
+        self, texts: List[str], vectors: List[Callable[[], List[float]]], dbs: List[DatabaseManager],
+        where: Optional[QueryFilter] = None, lexical: bool = True
+    ) -> List[Document]:
+        """Search every phrasing in every shard at once, then fuse all the ranked lists with RRF."""
+        top_k = self.config.get('retrieval', 'top_k')
+        bm25_weight, vector_weight = self.config.get('retrieval', 'hybrid_weights', [0.5, 0.5])
+        calls, weights, names = [], [], []
+        for db in dbs:
+            if lexical:
+                db.ensure_lexical_index()
+            for i, (text, vector) in enumerate(zip(texts, vectors)):
+                label = f"{db.name}:{i}" if len(dbs) > 1 else str(i)
+                calls.append(lambda db=db, vector=vector: [
+                    doc for doc, _ in db.vector_store.search_by_vector(vector(), k=top_k, where=where)
+                ])
+                weights.append(vector_weight)
+                names.append(f"vector[{label}]")
+                if lexical:
+                    calls.append(lambda db=db, text=text: [
+                        doc for doc, _ in db.lexical_index.search(text, k=top_k, where=where)
+                    ])
+                    weights.append(bm25_weight)
+                    names.append(f"bm25[{label}]")
+        results = gather_results(calls, self.config.get('retrieval', 'retriever_timeout', 10.0), names=names)
+        return reciprocal_rank_fusion(results, weights, top_k)
+
+    def vector_search(self, query: str, dbs: List[DatabaseManager], where: Optional[QueryFilter] = None) -> List[Document]:
+        return self.fan_out([query], [self._embed_async(query)], dbs, where, lexical=False)
+
+    def hybrid_search(self, query: str, dbs: List[DatabaseManager], where: Optional[QueryFilter] = None) -> List[Document]:
         log_step("Performing Hybrid Search (BM25 + Vector)...")
-        docs = self.db.get_all_documents()
-        if not docs: 
-            return []
-        
-        bm25 = BM25Retriever.from_documents(docs)
-        bm25.k = self.config.get('retrieval', 'top_k')
-        
-        ensemble = SimpleEnsembleRetriever(
-            retrievers=[bm25, self.vector_retriever], 
-            weights=[0.5, 0.5]
-        )
-        return ensemble.invoke(query)
+        return self.fan_out([query], [self._embed_async(query)], dbs, where)
 
-    def hyde_search(self, query: str) -> List[Document]:
+    def hyde_search(self, query: str, dbs: List[DatabaseManager], where: Optional[QueryFilter] = None) -> List[Document]:
         log_step("Executing HyDE (Hypothetical Document Embeddings)...")
+        return self.vector_search(self.hypothetical_passage(query), dbs, where)
+
+    def hypothetical_passage(self, query: str) -> str:
+        # The passage depends only on the question and the LLM, not the vault, so it outlives reindexing
+        key = f"{self.llm_model}|{normalize_query(query)}"
+        if self.cache:
+            cached = self.cache.get("hyde", key, version="0")
+            if cached is not None:
+                log_brain("⚡ Reusing cached hypothetical answer.")
+                return cached
         template = "Write a passage that answers: {question}"
-        hypothetical = (PromptTemplate.from_template(template) | self.llm | StrOutputParser()).invoke({"question": query})
+        with span("llm.hyde") as timing:
+            hypothetical = (PromptTemplate.from_template(template) | self.llm | StrOutputParser()).invoke({"question": query})
+            timing["chars"] = len(hypothetical)
         log_brain("Generated hypothetical answer for embedding alignment.")
-        return self.vector_retriever.invoke(hypothetical)
+        if self.cache:
+            self.cache.put("hyde", key, "0", hypothetical)
+        return hypothetical
 
-    def execute_retrieval(self, query: str) -> List[Document]:
-        strategy = self.config.get('retrieval', 'strategy')
-        
+    def multi_query_search(self, query: str, dbs: List[DatabaseManager], where: Optional[QueryFilter] = None) -> List[Document]:
+        log_step("Executing Multi-Query (LLM rewrites + parallel search)...")
+        queries = [query] + self.query_rewrites(query, self.config.get('retrieval', 'multi_query_count', 3))
+        log_brain(f"Searching {len(queries)} phrasings: {queries[1:]}")
+        # One batched embedding request for every phrasing, then all lookups at once
+        vectors = self.embed_queries(queries)
+        return self.fan_out(queries, [lambda v=v: v for v in vectors], dbs, where)
+
+    def query_rewrites(self, query: str, n: int) -> List[str]:
+        key = f"{self.llm_model}|{n}|{normalize_query(query)}"
+        if self.cache:
+            cached = self.cache.get("rewrites", key, version="0")
+            if cached is not None:
+                return cached
+        template = (
+            "Write {n} different search queries that would find notes answering the question below. "
+            "Vary the wording and keywords. One query per line, no numbering.\n\nQuestion: {question}"
+        )
+        with span("llm.rewrites", n=n):
+            raw = (PromptTemplate.from_template(template) | self.llm | StrOutputParser()).invoke({"question": query, "n": n})
+        rewrites = []
+        for line in raw.splitlines():
+            line = re.sub(r'^\s*(?:[-*•]|\d+[.)])\s*', '', line).strip().strip('"')
+            if line and line.lower() != query.lower() and line not in rewrites:
+                rewrites.append(line)
+        rewrites = rewrites[:n]
+        if self.cache:
+            self.cache.put("rewrites", key, "0", rewrites)
+        return rewrites
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        embeddings = self.shards.embedding_function
+        with span("embed.queries", queries=len(queries)):
+            if hasattr(embeddings, 'embed_queries'):
+                return embeddings.embed_queries(queries)
+            return embeddings.embed_documents(queries)
+
+    def expand_links(
+        self, query: str, docs: List[Document], dbs: List[DatabaseManager], where: Optional[QueryFilter] = None
+    ) -> List[Document]:
+        depth = self.config.get('retrieval', 'link_depth', 0)
+        if not depth or not docs:
+            return []
+        max_notes = self.config.get('retrieval', 'link_max_notes', 3)
+        with span("retrieve.links", depth=depth) as timing:
+            # Each shard has its own link graph; notes of other shards are simply not in it
+            linked = [d for db in dbs for d in db.linked_documents(
+                query, docs, depth=depth, max_notes=max_notes,
+                decay=self.config.get('retrieval', 'link_decay', 0.5),
+                where=where
+            )]
+            if len(dbs) > 1:
+                linked = sorted(linked, key=lambda d: d.metadata['link_score'], reverse=True)[:max_notes]
+            timing["docs"] = len(linked)
+        seen = {doc_key(d) for d in docs}
+        linked = [d for d in linked if doc_key(d) not in seen]
+        if linked:
+            log_brain(f"Followed wikilinks to {len(linked)} related notes.")
+        return linked
+
+    def execute_retrieval(
+        self, query: str, strategy: str = None, where: Optional[QueryFilter] = None, vaults: Sequence[str] = None
+    ) -> List[Document]:
+        """Retrieve from the given vaults (default: every configured shard), optionally scoped by `where`."""
+        strategy = strategy or self.config.get('retrieval', 'strategy')
+        dbs = self.shards.select(vaults)
+        if where is not None and not where.active:
+            where = None
+        with span("retrieve", strategy=strategy, scoped=where is not None, shards=len(dbs)) as timing:
+            if where is not None:
+                log_brain(f"Scoped to notes {where.describe()}.")
+            if len(self.shards) > 1:
+                log_brain(f"Searching vaults: {', '.join(db.name for db in dbs)}")
+            docs = self._cached_retrieve(query, strategy, timing, dbs, where)
+            timing["docs"] = len(docs)
+        return docs
+
+    def _cached_retrieve(
+        self, query: str, strategy: str, timing: Dict, dbs: List[DatabaseManager], where: Optional[QueryFilter] = None
+    ) -> List[Document]:
+        timing["cache"] = "off"
+        if not self.cache:
+            return self._retrieve(query, strategy, dbs, where)
+
+        # Read the version first so a concurrent reindex can't stamp old results as new; only the
+        # searched shards count, so reindexing one vault keeps the others' cached results
+        version = self.shards.cache_version(dbs)
+        scope = f"{strategy}|{self.config.get('retrieval', 'top_k')}|crag={bool(self.grader)}"
+        if len(self.shards) > 1:
+            scope += f"|vaults={','.join(sorted(db.name for db in dbs))}"
+        if where is not None:
+            scope += f"|{where.key()}"
+        key = f"{scope}|{normalize_query(query)}"
+        embedding = self.query_embedding(query) if self.cache.semantic else None
+        cached = self.cache.get("retrieval", key, version, scope=scope, embedding=embedding)
+        timing["cache"] = "miss" if cached is None else "hit"
+        if cached is not None:
+            log_brain("⚡ Retrieval cache hit.")
+            return [doc_from_dict(d) for d in cached]
+
+        docs = self._retrieve(query, strategy, dbs, where)
+        if docs:
+            self.cache.put("retrieval", key, version, [doc_to_dict(d) for d in docs], scope=scope, embedding=embedding)
+        return docs
+
+    def _retrieve(
+        self, query: str, strategy: str, dbs: List[DatabaseManager], where: Optional[QueryFilter] = None
+    ) -> List[Document]:
+        pending = self.speculative_web(query, dbs)
         try:
-            if strategy == "hybrid": docs = self.hybrid_search(query)
-            elif strategy == "hyde": docs = self.hyde_search(query)
-            else: docs = self.vector_retriever.invoke(query)
+            with span(f"retrieve.{strategy}"):
+                if strategy == "hybrid": docs = self.hybrid_search(query, dbs, where)
+                elif strategy == "hyde": docs = self.hyde_search(query, dbs, where)
+                elif strategy == "multi_query": docs = self.multi_query_search(query, dbs, where)
+                else: docs = self.vector_search(query, dbs, where)
         except Exception as e:
             logger.error(f"Retrieval strategy '{strategy}' failed: {e}")
-            docs = self.vector_retriever.invoke(query)
-        
-        if not docs and self.config.get('retrieval', 'web_fallback'):
-            log_step("⚠️ Local context missing. Triggering Web Search...")
-            try:
-                web_res = self.web_search.invoke(query)
-                return [Document(page_content=web_res, metadata={"source": "DuckDuckGo", "filename": "Web"})]
-            except Exception as e:
-                logger.error(f"Web search failed: {e}")
-                return []
-            
-        return docs
\ No newline at end of file
+            docs = self.vector_search(query, dbs, where)
+
+        docs = docs + self.expand_links(query, docs, dbs, where)
+
+        # With CRAG on, "too little context" means too few chunks survived grading
+        needed, rejected = 1, []
+        if self.grader and docs:
+            log_step("Grading retrieved context (CRAG)...")
+            with span("retrieve.crag", docs_in=len(docs)) as timing:
+                docs, rejected = self.grader.grade(query, docs)
+                timing["docs_out"] = len(docs)
+            needed = self.config.get('crag', 'min_docs', 2)
+
+        if len(docs) < needed:
+            web = self.web.collect(pending or self.web.start(query)) if self.web else []
+            if web:
+                docs = docs + web
+            elif rejected:
+                # Rejected local context still beats answering from nothing
+                backfill = rejected[:needed - len(docs)]
+                log_brain(f"No web results; keeping the {len(backfill)} best-scoring rejected chunks.")
+                docs = docs + backfill
+        elif pending is not None:
+            self.web.cancel(pending)
+        return docs
+
+    def speculative_web(self, query: str, dbs: List[DatabaseManager]):
+        """Start the web search right away when few of the question's words occur in any selected vault."""
+        if not self.web or self.web.speculate_below is None:
+            return None
+        coverage = 0.0
+        for db in dbs:
+            db.ensure_lexical_index()
+            coverage = max(coverage, db.lexical_index.coverage(query))
+        if coverage >= self.web.speculate_below:
+            return None
+        log_brain(f"Only {coverage:.0%} of the question's words are in the notes; searching the web alongside.")
+        return self.web.start(query)
@@ -0,0 +1,161 @@
+import json
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Tuple
+from langchain_core.documents import Document
+from core.document_parser import doc_from_dict, doc_to_dict
+from core.filters import QueryFilter
+from utils.logger import logger, log_step
+from utils.tracing import tracer
+
+class BrainRequestHandler(BaseHTTPRequestHandler):
+    """JSON API over a resident Brain.
+
+    GET  /health    -> {"status": "ok", "vaults": {name: path}}
+    GET  /metrics   -> per-stage timing totals in Prometheus text format
+    POST /retrieve  {"query", "strategy"?, "filter"?, "vaults"?} -> {"docs": [...]}
+    POST /ask       {"query", "strategy"?, "filter"?, "vaults"?} -> NDJSON stream of
+                    {"type": "sources"}, {"type": "token"}..., {"type": "done"}
+
+    "filter" is {"folders": [...], "tags": [...], "since": ..., "until": ...};
+    "vaults" lists the shards to search (default: all).
+    """
+    brain = None  # set by serve()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "vaults": {db.name: str(db.parser.vault_path) for db in self.brain.shards}})
+        elif self.path == "/metrics":
+            body = tracer.metrics_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            request = self._read_json()
+            query = request["query"]
+        except (ValueError, KeyError):
+            self._send_json(400, {"error": "expected a JSON body with a 'query'"})
+            return
+
+        if self.path not in ("/retrieve", "/ask"):
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            where = QueryFilter.from_dict(request.get("filter"))
+            self.brain.shards.select(request.get("vaults"))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            docs = self.brain.retrieve(query, strategy=request.get("strategy"), where=where, vaults=request.get("vaults"))
+        except Exception as e:
+            logger.error(f"Retrieval failed: {e}")
+            self._send_json(500, {"error": str(e)})
+            return
+
+        if self.path == "/retrieve":
+            self._send_json(200, {"docs": [doc_to_dict(d) for d in docs]})
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            self._emit({"type": "sources", "docs": [doc_to_dict(d) for d in docs]})
+            try:
+                for token in self.brain.stream_answer(query, docs):
+                    self._emit({"type": "token", "text": token})
+                self._emit({"type": "done"})
+            except Exception as e:
+                self._emit({"type": "error", "error": str(e)})
+
+    def _emit(self, event: Dict):
+        self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+def serve(brain, host: str = "127.0.0.1", port: int = 8765):
+    """Serve the brain until interrupted; one thread per client connection."""
+    handler = type("Handler", (BrainRequestHandler,), {"brain": brain})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    log_step(f"🧠 Serving on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+class BrainClient:
+    """Talks to a running `main.py serve`."""
+
+    def __init__(self, url: str, timeout: float = 300.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def available(self) -> bool:
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=0.3) as response:
+                return response.status == 200
+        except (OSError, urllib.error.URLError):
+            return False
+
+    def _post(self, path: str, payload: Dict):
+        request = urllib.request.Request(
+            f"{self.url}{path}", data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if 400 <= e.code < 500:
+                # A request the server refused (unknown vault, bad filter): its JSON error says why
+                try:
+                    message = json.loads(e.read()).get("error")
+                except ValueError:
+                    message = None
+                raise ValueError(message or f"HTTP {e.code}") from None
+            raise
+
+    def retrieve(self, query: str, strategy: str = None, where: QueryFilter = None,
+                 vaults: List[str] = None) -> List[Document]:
+        payload = {"query": query, "strategy": strategy, "filter": where.to_dict() if where else None, "vaults": vaults}
+        with self._post("/retrieve", payload) as response:
+            docs = json.load(response)["docs"]
+        return [doc_from_dict(d) for d in docs]
+
+    def ask(self, query: str, strategy: str = None, where: QueryFilter = None,
+            vaults: List[str] = None) -> Tuple[List[Document], Iterator[str]]:
+        """Sources as soon as retrieval is done, then a token stream."""
+        response = self._post("/ask", {"query": query, "strategy": strategy,
+                                       "filter": where.to_dict() if where else None, "vaults": vaults})
+        first = json.loads(response.readline())
+        docs = [doc_from_dict(d) for d in first.get("docs", [])]
+
+        def tokens():
+            with response:
+                for line in response:
+                    event = json.loads(line)
+                    if event["type"] == "token":
+                        yield event["text"]
+                    elif event["type"] == "error":
+                        raise RuntimeError(event["error"])
+        return docs, tokens()
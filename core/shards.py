@@ -0,0 +1,110 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Sequence, Tuple
+from core.config_loader import ConfigLoader
+from core.database import DatabaseManager
+from core.ollama_client import OllamaClient
+from utils.logger import log_step
+from utils.tracing import propagate
+
+DEFAULT_SHARD = "default"
+SHARD_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+class Shard(NamedTuple):
+    """One independently indexed vault (or vault subtree)."""
+    name: str
+    vault_path: str
+    persist_directory: str
+    collection: str = "obsidian_vault"
+    exclude: Tuple[str, ...] = ()  # Nested shards, carved out of this one
+
+def default_shard(config: ConfigLoader) -> Shard:
+    """The single vault of `system.vault_path`, stored directly in `chroma_path` as before shards existed."""
+    return Shard(DEFAULT_SHARD, config.get('system', 'vault_path'), config.get('system', 'chroma_path'))
+
+def _inside(path: str, root: str) -> bool:
+    return os.path.commonpath([os.path.abspath(path), os.path.abspath(root)]) == os.path.abspath(root)
+
+def check_vaults(names: Sequence[str], configured: Sequence[str]):
+    """Raise ValueError naming any of `names` that is not a configured vault."""
+    unknown = [n for n in names if n not in configured]
+    if unknown:
+        raise ValueError(f"Unknown vault {', '.join(unknown)} (configured: {', '.join(configured)})")
+
+def configured_shards(config: ConfigLoader) -> List[Shard]:
+    """Shards from the `vaults` list, or just the default shard when it is empty.
+
+    Each named shard keeps its collection, lexical index, manifest and link
+    graph under `chroma_path/shards/<name>`, so rebuilding one never touches
+    another. A shard inside another shard's folder is skipped by the outer one.
+    """
+    entries = config.config.get('vaults') or []
+    if not entries:
+        return [default_shard(config)]
+    base = Path(config.get('system', 'chroma_path')) / "shards"
+    shards, seen = [], set()
+    for entry in entries:
+        name, path = str(entry.get('name', '')), os.path.expanduser(str(entry.get('path', '')))
+        if not SHARD_NAME.match(name):
+            raise ValueError(f"Vault name '{name}' must be letters, digits, '-' or '_'")
+        if name in seen:
+            raise ValueError(f"Vault '{name}' is configured twice")
+        seen.add(name)
+        shards.append(Shard(name, path, str(base / name), f"obsidian_vault_{name}"))
+    for i, shard in enumerate(shards):
+        for other in shards[i + 1:]:
+            if os.path.abspath(shard.vault_path) == os.path.abspath(other.vault_path):
+                raise ValueError(f"Vaults '{shard.name}' and '{other.name}' have the same path")
+    return [s._replace(exclude=tuple(o.vault_path for o in shards if o is not s and _inside(o.vault_path, s.vault_path)))
+            for s in shards]
+
+class ShardSet:
+    """Every configured shard, each with its own DatabaseManager."""
+
+    def __init__(self, config: ConfigLoader, ollama: OllamaClient):
+        self.config = config
+        self.persist_directory = config.get('system', 'chroma_path')
+        self.shards: Dict[str, DatabaseManager] = {
+            shard.name: DatabaseManager(config, ollama, shard) for shard in configured_shards(config)
+        }
+
+    def __iter__(self) -> Iterator[DatabaseManager]:
+        return iter(self.shards.values())
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def __getitem__(self, name: str) -> DatabaseManager:
+        return self.shards[name]
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.shards)
+
+    @property
+    def embedding_function(self):
+        # Every shard embeds with the same model, so queries are embedded once for all of them
+        return next(iter(self)).embedding_function
+
+    def cache_version(self, dbs: Sequence[DatabaseManager]) -> str:
+        """Stamp for results cached from `dbs`: changes only when one of those shards changes or is rebuilt."""
+        return ",".join(f"{db.name}:{db.cache_version}" for db in sorted(dbs, key=lambda db: db.name))
+
+    def select(self, names: Sequence[str] = None) -> List[DatabaseManager]:
+        if not names:
+            return list(self)
+        check_vaults(names, self.shards)
+        return [self.shards[n] for n in dict.fromkeys(names)]
+
+    def index(self, names: Sequence[str] = None) -> Dict[str, int]:
+        """Index the selected shards, several at once; returns documents processed per shard."""
+        dbs = self.select(names)
+        if len(dbs) == 1:
+            return {dbs[0].name: dbs[0].index_vault()}
+        workers = self.config.get('ingestion', 'parallel_shards', 2) or len(dbs)
+        log_step(f"Indexing {len(dbs)} vaults ({min(workers, len(dbs))} at a time)...")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard") as pool:
+            futures = {db.name: pool.submit(propagate(db.index_vault)) for db in dbs}
+            return {name: future.result() for name, future in futures.items()}
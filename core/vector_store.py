@@ -0,0 +1,441 @@
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from core.filters import QueryFilter, filter_columns
+from utils.logger import log_brain
+from utils.sqlite import open_database, transaction
+from utils.tracing import span
+
+class VectorStore(ABC):
+    """What DatabaseManager needs from a vector backend.
+
+    `search*` return (document, score) pairs best first; scores are only
+    comparable within one backend (Chroma reports distances, NumPy cosine).
+    A `where` scope is applied inside the store, before top-k is taken.
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+
+    @abstractmethod
+    def upsert(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]],
+               documents: Sequence[str], metadatas: Sequence[Dict]):
+        ...
+
+    @abstractmethod
+    def update_metadata(self, ids: Sequence[str], metadatas: Sequence[Dict]):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]):
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def get(self, include_documents: bool = True) -> List[Document]:
+        """Every stored chunk (full scan, avoid on the query path)."""
+
+    @abstractmethod
+    def search_by_vector(self, vector: Sequence[float], k: int = 5,
+                         where: Optional[QueryFilter] = None) -> List[Tuple[Document, float]]:
+        ...
+
+    def search(self, query: str, k: int = 5, where: Optional[QueryFilter] = None) -> List[Tuple[Document, float]]:
+        return self.search_by_vector(self.embedding_function.embed_query(query), k, where)
+
+class ChromaVectorStore(VectorStore):
+    """The original backend: a persistent Chroma collection.
+
+    Chroma metadata filters have no prefix or substring match, so folder and
+    tag scopes are resolved to note paths through `catalog` (the lexical
+    index) and pushed down as a `source` `$in` clause; dates go in directly.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function, collection: str = "obsidian_vault", catalog=None):
+        super().__init__(embedding_function)
+        self.catalog = catalog
+        from langchain_chroma import Chroma
+        self.store = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embedding_function,
+            collection_name=collection
+        )
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        # Vectors are precomputed by the pipeline, so write straight to the collection
+        self.store._collection.upsert(ids=list(ids), embeddings=embeddings, documents=list(documents), metadatas=list(metadatas))
+
+    def update_metadata(self, ids, metadatas):
+        self.store._collection.update(ids=list(ids), metadatas=list(metadatas))
+
+    def delete(self, ids):
+        self.store.delete(ids=list(ids))
+
+    def count(self) -> int:
+        return self.store._collection.count()
+
+    def get(self, include_documents: bool = True) -> List[Document]:
+        data = self.store.get(include=['documents', 'metadatas'] if include_documents else ['metadatas'])
+        documents = data.get('documents') or [""] * len(data['ids'])
+        return [Document(id=i, page_content=t or "", metadata=m or {})
+                for i, t, m in zip(data['ids'], documents, data['metadatas'])]
+
+    def _where(self, where: QueryFilter) -> Optional[Dict]:
+        clauses = []
+        if where.folders or where.tags:
+            sources = self.catalog.sources(where._replace(since=None, until=None))
+            if not sources:
+                return None
+            clauses.append({"source": {"$in": sources}})
+        if where.since is not None:
+            clauses.append({"mtime": {"$gte": where.since}})
+        if where.until is not None:
+            clauses.append({"mtime": {"$lt": where.until}})
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def search_by_vector(self, vector, k=5, where=None):
+        if where is None or not where.active:
+            return self.store.similarity_search_by_vector_with_relevance_scores(vector, k=k)
+        chroma_where = self._where(where)
+        if chroma_where is None:
+            return []
+        return self.store.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=chroma_where)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    row INTEGER PRIMARY KEY,
+    chunk_id TEXT,
+    document TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    cluster INTEGER NOT NULL DEFAULT -1,
+    alive INTEGER NOT NULL DEFAULT 1,
+    source TEXT,
+    folder TEXT,
+    tags TEXT,
+    mtime REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS rows_chunk ON rows(chunk_id) WHERE alive = 1;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# Filter columns, added to stores created before query scoping existed
+FILTER_COLUMNS = {"source": "TEXT", "folder": "TEXT", "tags": "TEXT", "mtime": "REAL"}
+
+class _Snapshot:
+    """Immutable view of the live rows used by one search."""
+
+    def __init__(self, generation, matrix, rows, clusters, centroids):
+        self.generation = generation  # vectors file the row numbers point into
+        self.matrix = matrix          # memmap (n_total, dim) or None
+        self.rows = rows              # live row numbers, ascending
+        self.clusters = clusters      # cluster of each live row (-1 = unassigned)
+        self.centroids = centroids    # (n_clusters, dim) float32 or None
+
+class NumpyVectorStore(VectorStore):
+    """Embedded vector store: one memory-mapped matrix plus a SQLite sidecar.
+
+    Vectors are L2-normalised and appended to `vectors.<generation>.<dtype>`;
+    row numbers in the sidecar point into that file. Upserts append and
+    tombstone the previous row, deletes only tombstone; once dead rows pass
+    `compact_ratio` the live rows are copied into the next generation file.
+    Search is a vectorized dot product over the mmap (the OS page cache keeps
+    it warm, nothing is loaded at open). Past `ivf_min_rows` live rows a
+    coarse k-means index narrows the scan to the `nprobe` nearest cells.
+    """
+
+    BLOCK_ROWS = 65536
+
+    def __init__(self, directory, embedding_function, dtype: str = "float32", clusters: int = 0,
+                 ivf_min_rows: int = 50000, nprobe: int = 8, compact_ratio: float = 0.3):
+        super().__init__(embedding_function)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.conn = open_database(self.directory / "store.sqlite")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(rows)")}
+        for column, kind in FILTER_COLUMNS.items():
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE rows ADD COLUMN {column} {kind}")
+        self._lock = threading.RLock()
+        # The dtype is fixed when the store is created; later config changes need a rebuild
+        self.dtype = np.dtype(self._meta("dtype") or dtype)
+        self.clusters = clusters
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.compact_ratio = compact_ratio
+        self._cache: Tuple[Tuple, Optional[_Snapshot]] = ((), None)
+
+    def _meta(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key: str, value):
+        self.conn.execute(
+            "INSERT INTO meta(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value)),
+        )
+
+    def _bump(self):
+        self._set_meta("version", self._meta("version", 0) + 1)
+
+    def _path(self, generation: int) -> Path:
+        return self.directory / f"vectors.{generation}.{self.dtype.name}"
+
+    def _row_bytes(self) -> int:
+        return self._meta("dim") * self.dtype.itemsize
+
+    @staticmethod
+    def _normalise(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _tombstone(self, ids: Sequence[str]) -> int:
+        params = list(ids)
+        if not params:
+            return 0
+        return self.conn.execute(
+            f"UPDATE rows SET alive = 0, chunk_id = NULL WHERE alive = 1 AND chunk_id IN ({','.join('?' * len(params))})",
+            params,
+        ).rowcount
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = self._normalise(np.asarray(embeddings, dtype=np.float32))
+        with self._lock, transaction(self.conn):
+            if self._meta("dim") is None:
+                self._set_meta("dim", int(vectors.shape[1]))
+                self._set_meta("dtype", self.dtype.name)
+                self._set_meta("generation", 0)
+            elif vectors.shape[1] != self._meta("dim"):
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self._meta('dim')})")
+            row_bytes = self._row_bytes()
+            # Appending inside the write transaction keeps row numbers unique across processes
+            with open(self._path(self._meta("generation")), "ab") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size % row_bytes:
+                    # A torn write from a crash is never referenced by the sidecar; drop it
+                    f.truncate(size - size % row_bytes)
+                    size -= size % row_bytes
+                f.write(vectors.astype(self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            start = size // row_bytes
+            self._tombstone(ids)
+            centroids = self._centroids()
+            assigned = self._assign(vectors, centroids) if centroids is not None else [-1] * len(vectors)
+            self.conn.executemany(
+                "INSERT INTO rows(row, chunk_id, document, metadata, cluster, source, folder, tags, mtime) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(start + i, cid, doc, json.dumps(meta), int(c), meta.get("source"), *filter_columns(meta))
+                 for i, (cid, doc, meta, c) in enumerate(zip(ids, documents, metadatas, assigned))],
+            )
+            self._bump()
+        self._maintain()
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock, transaction(self.conn):
+            self.conn.executemany(
+                "UPDATE rows SET metadata = ?, source = ?, folder = ?, tags = ?, mtime = ? WHERE alive = 1 AND chunk_id = ?",
+                [(json.dumps(meta), meta.get("source"), *filter_columns(meta), cid) for cid, meta in zip(ids, metadatas)],
+            )
+
+    def delete(self, ids):
+        with self._lock, transaction(self.conn):
+            if self._tombstone(ids):
+                self._bump()
+        self._maintain()
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM rows WHERE alive = 1").fetchone()[0]
+
+    def get(self, include_documents: bool = True) -> List[Document]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT chunk_id, document, metadata FROM rows WHERE alive = 1 ORDER BY row"
+            ).fetchall()
+        return [Document(id=cid, page_content=doc if include_documents else "", metadata=json.loads(meta))
+                for cid, doc, meta in rows]
+
+    # --- search ---
+
+    def _centroids(self) -> Optional[np.ndarray]:
+        name = self._meta("centroids")
+        return np.load(self.directory / name) if name else None
+
+    def _snapshot(self) -> Optional[_Snapshot]:
+        with self._lock:
+            key = (self._meta("version", 0), self._meta("generation", 0), self._meta("centroids"))
+            if key == self._cache[0]:
+                return self._cache[1]
+            live = self.conn.execute("SELECT row, cluster FROM rows WHERE alive = 1 ORDER BY row").fetchall()
+            snapshot = None
+            if live:
+                path = self._path(key[1])
+                n_total = path.stat().st_size // self._row_bytes()
+                matrix = np.memmap(path, dtype=self.dtype, mode="r", shape=(n_total, self._meta("dim")))
+                data = np.array(live, dtype=np.int64)
+                snapshot = _Snapshot(key[1], matrix, data[:, 0], data[:, 1], self._centroids())
+            self._cache = (key, snapshot)
+            return snapshot
+
+    def _score(self, snapshot: _Snapshot, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        matrix = snapshot.matrix
+        if len(rows) * 4 < len(matrix):
+            # Few candidates (IVF cells, a narrow scope): gather just those rows
+            return np.concatenate([
+                matrix[rows[s:s + self.BLOCK_ROWS]].astype(np.float32) @ query
+                for s in range(0, len(rows), self.BLOCK_ROWS)
+            ])
+        # Mostly live: stream the whole file in blocks, then pick the live rows
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for s in range(0, len(matrix), self.BLOCK_ROWS):
+            scores[s:s + self.BLOCK_ROWS] = np.asarray(matrix[s:s + self.BLOCK_ROWS], dtype=np.float32) @ query
+        return scores[rows]
+
+    def _scoped_rows(self, where: QueryFilter) -> np.ndarray:
+        clause, params = where.sql()
+        with self._lock:
+            rows = self.conn.execute(f"SELECT row FROM rows WHERE alive = 1{clause} ORDER BY row", params).fetchall()
+        return np.array([r for r, in rows], dtype=np.int64)
+
+    def search_by_vector(self, vector, k=5, where=None):
+        while True:
+            snapshot = self._snapshot()
+            if snapshot is None or k <= 0:
+                return []
+            best, scores = self._nearest(snapshot, vector, k, where)
+            if not best:
+                return []
+            with self._lock:
+                # Scoring runs unlocked; a compaction meanwhile renumbered the rows, so search again
+                if self._meta("generation", 0) != snapshot.generation:
+                    continue
+                found = {row: (cid, doc, meta) for row, cid, doc, meta in self.conn.execute(
+                    "SELECT row, chunk_id, document, metadata FROM rows "
+                    f"WHERE alive = 1 AND row IN ({','.join('?' * len(best))})", best
+                )}
+            return [
+                (Document(id=found[r][0], page_content=found[r][1], metadata=json.loads(found[r][2])), s)
+                for r, s in zip(best, scores) if r in found
+            ]
+
+    def _nearest(self, snapshot: _Snapshot, vector, k: int, where) -> Tuple[List[int], List[float]]:
+        """Rows of the `k` best-scoring live vectors in the snapshot, best first, with their scores."""
+        with span("vector.numpy_search") as timing:
+            query = self._normalise(np.asarray(vector, dtype=np.float32))
+            rows = snapshot.rows
+            if where is not None and where.active:
+                # Only in-scope rows are scored; a scope small enough is searched exactly
+                rows = np.intersect1d(rows, self._scoped_rows(where), assume_unique=True)
+            if (snapshot.centroids is not None and self.nprobe < len(snapshot.centroids)
+                    and len(rows) >= self.ivf_min_rows):
+                cells = np.argpartition(-(snapshot.centroids @ query), self.nprobe)[:self.nprobe]
+                clusters = snapshot.clusters[np.searchsorted(snapshot.rows, rows)]
+                rows = rows[np.isin(clusters, cells) | (clusters < 0)]
+            timing["candidates"] = len(rows)
+            if not len(rows):
+                return [], []
+            scores = self._score(snapshot, rows, query)
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        return [int(r) for r in rows[top]], [float(s) for s in scores[top]]
+
+    # --- maintenance ---
+
+    def _maintain(self):
+        with self._lock:
+            total, live = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(alive), 0) FROM rows").fetchone()
+            if total >= 1000 and total - live > self.compact_ratio * total:
+                self._compact()
+            clusters = self.clusters or (int(np.sqrt(live)) if live >= self.ivf_min_rows else 0)
+            trained = self._meta("trained_rows", 0)
+            if clusters and live >= self.ivf_min_rows and (not trained or live >= 2 * trained):
+                self._train(clusters)
+
+    def _compact(self):
+        """Copy live rows into the next generation file and renumber them."""
+        with span("vector.numpy_compact") as timing, transaction(self.conn):
+            generation = self._meta("generation", 0)
+            live = [r for r, in self.conn.execute("SELECT row FROM rows WHERE alive = 1 ORDER BY row")]
+            source = self._path(generation)
+            matrix = np.memmap(source, dtype=self.dtype, mode="r",
+                               shape=(source.stat().st_size // self._row_bytes(), self._meta("dim")))
+            target = self._path(generation + 1)
+            with open(target, "wb") as f:
+                for s in range(0, len(live), self.BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(matrix[live[s:s + self.BLOCK_ROWS]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            del matrix
+            self.conn.execute("DELETE FROM rows WHERE alive = 0")
+            # Ascending order never collides: a row only ever moves down to its rank
+            self.conn.executemany("UPDATE rows SET row = ? WHERE row = ?", list(enumerate(live)))
+            self._set_meta("generation", generation + 1)
+            self._bump()
+            timing["rows"] = len(live)
+        source.unlink(missing_ok=True)
+        log_brain(f"Compacted vector store to {len(live)} rows.")
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1)
+
+    def _train(self, n_clusters: int, iterations: int = 10, seed: int = 0):
+        """Spherical k-means on a sample of live rows, then assign every row to its cell."""
+        with span("vector.numpy_train", clusters=n_clusters) as timing:
+            snapshot = self._snapshot()
+            rng = np.random.default_rng(seed)
+            sample_rows = rng.choice(snapshot.rows, size=min(len(snapshot.rows), 256 * n_clusters), replace=False)
+            sample = np.asarray(snapshot.matrix[np.sort(sample_rows)], dtype=np.float32)
+            centroids = sample[rng.choice(len(sample), size=n_clusters, replace=False)]
+            for _ in range(iterations):
+                labels = self._assign(sample, centroids)
+                for c in range(n_clusters):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = self._normalise(centroids)
+
+            assignments = []
+            for s in range(0, len(snapshot.rows), self.BLOCK_ROWS):
+                rows = snapshot.rows[s:s + self.BLOCK_ROWS]
+                labels = self._assign(np.asarray(snapshot.matrix[rows], dtype=np.float32), centroids)
+                assignments.extend(zip(labels.tolist(), rows.tolist()))
+
+            name = f"centroids.{self._meta('version', 0)}.npy"
+            np.save(self.directory / name, centroids)
+            previous = self._meta("centroids")
+            with transaction(self.conn):
+                self.conn.executemany("UPDATE rows SET cluster = ? WHERE row = ?", assignments)
+                self._set_meta("centroids", name)
+                self._set_meta("trained_rows", len(snapshot.rows))
+            if previous and previous != name:
+                (self.directory / previous).unlink(missing_ok=True)
+            timing["rows"] = len(snapshot.rows)
+        log_brain(f"Trained a {n_clusters}-cell coarse index over {len(snapshot.rows)} vectors.")
+
+def open_vector_store(config, persist_directory: str, embedding_function,
+                      collection: str = "obsidian_vault", catalog=None) -> VectorStore:
+    """The backend selected by `vector_store.backend` in config.yaml."""
+    settings = config.get('vector_store') or {}
+    backend = settings.get('backend', 'chroma')
+    if backend == "numpy":
+        return NumpyVectorStore(
+            Path(persist_directory) / "numpy_store", embedding_function,
+            dtype=settings.get('dtype', 'float32'),
+            clusters=settings.get('clusters', 0),
+            ivf_min_rows=settings.get('ivf_min_rows', 50000),
+            nprobe=settings.get('nprobe', 8),
+            compact_ratio=settings.get('compact_ratio', 0.3),
+        )
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector_store.backend '{backend}' (expected chroma or numpy)")
+    return ChromaVectorStore(persist_directory, embedding_function, collection, catalog)
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Set, Tuple
+from core.database import DatabaseManager
+from utils.logger import logger, log_step, log_brain
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # Optional: fall back to polling
+    Observer = None
+    FileSystemEventHandler = object
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, watcher: "VaultWatcher"):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        # A folder's own mtime changes whenever its contents do; those files report themselves
+        if event.is_directory and event.event_type == "modified":
+            return
+        self.watcher.notify(event.src_path)
+        if getattr(event, "dest_path", None):
+            self.watcher.notify(event.dest_path)
+
+class VaultWatcher:
+    """Keeps the index fresh by reindexing only the notes that change.
+
+    Events are coalesced into a set of paths and flushed once the vault has
+    been quiet for `debounce` seconds (or after `max_delay` during a long
+    burst such as a git pull), so repeated autosaves of one note cost a single
+    reindex. With no pending changes the loop sleeps on an event, not a timer.
+    """
+
+    def __init__(self, db: DatabaseManager, debounce: float = 2.0, max_delay: float = 30.0,
+                 poll: bool = False, poll_interval: float = 10.0):
+        self.db = db
+        self.root = db.parser.vault_path
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll = poll or Observer is None
+        self.poll_interval = poll_interval
+        self._pending: Set[Path] = set()
+        self._first_event = self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def notify(self, raw_path: str):
+        # Map onto the vault path exactly as configured so keys match the manifest
+        path = self.root / os.path.relpath(raw_path, os.path.abspath(self.root))
+        if not self.db.parser.in_vault(path):
+            return
+        # Folder names may contain dots, so tell folders from other files by looking at the disk;
+        # a path that is already gone may have been a folder, and reindexing it drops its notes
+        if path.suffix != '.md' and path.exists() and not path.is_dir():
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_event = now
+            self._pending.add(path)
+            self._last_event = now
+        self._wake.set()
+
+    def _due(self):
+        """Seconds until the pending batch should flush, or None if nothing is pending."""
+        with self._lock:
+            if not self._pending:
+                return None
+            now = time.monotonic()
+            return max(0.0, min(self._last_event + self.debounce, self._first_event + self.max_delay) - now)
+
+    def _flush(self):
+        with self._lock:
+            paths, self._pending = sorted(self._pending), set()
+        try:
+            self.db.index_vault(paths=paths)
+        except Exception as e:
+            logger.error(f"Reindex of {len(paths)} paths failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run(self):
+        # Watch first, so notes saved while the catch-up runs are queued instead of missed
+        if self.poll:
+            # The baseline is taken before the catch-up scans, so any later save shows up as a change
+            source = threading.Thread(target=self._poll_loop, args=(self._snapshot(),), daemon=True)
+            source.start()
+        else:
+            source = Observer()
+            source.schedule(_ChangeHandler(self), str(self.root), recursive=True)
+            source.start()
+        try:
+            log_step("Catching up before watching...")
+            self.db.index_vault()
+            if self.poll:
+                log_step(f"👀 Polling {self.root} every {self.poll_interval}s (Ctrl+C to stop)")
+            else:
+                log_step(f"👀 Watching {self.root} (Ctrl+C to stop)")
+            while not self._stop.is_set():
+                self._wake.wait(timeout=self._due())
+                self._wake.clear()
+                due = self._due()
+                if due is not None and due <= 0:
+                    self._flush()
+        finally:
+            if not self.poll:
+                source.stop()
+                source.join()
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        return {str(p): (s.st_mtime_ns, s.st_size) for p, s in self.db.parser.scan_vault()}
+
+    def _poll_loop(self, previous: Dict[str, Tuple[int, int]]):
+        """Fallback for filesystems without change notification: diff stat snapshots."""
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            changed = {p for p in current.keys() | previous.keys() if current.get(p) != previous.get(p)}
+            for path in changed:
+                self.notify(path)
+            if changed:
+                log_brain(f"Detected {len(changed)} changed notes.")
+            previous = current
@@ -0,0 +1,144 @@
+import importlib
+import json
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+from langchain_core.documents import Document
+from core.document_parser import doc_from_dict, doc_to_dict
+from core.result_cache import ResultCache, normalize_query
+from utils.logger import logger, log_brain, log_step
+from utils.tracing import propagate, span
+
+class WebSearchProvider(ABC):
+    """Turns a question into web results.
+
+    Set `web.provider` to "package.module:Class" to plug in another one; it is
+    built with the ConfigLoader and must be safe to call from a worker thread.
+    """
+    name = "web"
+
+    def __init__(self, config):
+        self.config = config
+
+    @abstractmethod
+    def search(self, query: str) -> List[Document]:
+        ...
+
+class DuckDuckGoProvider(WebSearchProvider):
+    """The original fallback: DuckDuckGo's result snippets as one document."""
+    name = "duckduckgo"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._tool = None  # langchain_community is slow to import, so only the first search pays for it
+
+    def search(self, query: str) -> List[Document]:
+        if self._tool is None:
+            from langchain_community.tools import DuckDuckGoSearchRun
+            self._tool = DuckDuckGoSearchRun()
+        text = self._tool.invoke(query)
+        return [Document(page_content=text, metadata={"source": "DuckDuckGo", "filename": "Web"})] if text else []
+
+class StaticProvider(WebSearchProvider):
+    """Canned results from a JSON file, a local stand-in for tests and benchmarks.
+
+    The file maps questions to a text or a list of texts; "*" answers any other
+    question. `web.static_latency` seconds are slept first to mimic the network.
+    """
+    name = "static"
+
+    def __init__(self, config):
+        super().__init__(config)
+        settings = config.get('web') or {}
+        path = settings.get('static_path')
+        entries = json.loads(Path(path).expanduser().read_text(encoding="utf-8")) if path else {}
+        self.results = {normalize_query(q): v for q, v in entries.items()}
+        self.latency = settings.get('static_latency', 0.0)
+
+    def search(self, query: str) -> List[Document]:
+        if self.latency:
+            time.sleep(self.latency)
+        texts = self.results.get(normalize_query(query), self.results.get("*", []))
+        texts = [texts] if isinstance(texts, str) else texts
+        return [Document(page_content=t, metadata={"source": "static", "filename": "Web"}) for t in texts]
+
+PROVIDERS = {"duckduckgo": DuckDuckGoProvider, "static": StaticProvider}
+
+def open_web_provider(config) -> WebSearchProvider:
+    """The provider selected by `web.provider` in config.yaml."""
+    name = (config.get('web') or {}).get('provider', 'duckduckgo')
+    if name in PROVIDERS:
+        return PROVIDERS[name](config)
+    module, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown web.provider '{name}' (expected {', '.join(PROVIDERS)} or package.module:Class)")
+    return getattr(importlib.import_module(module), attr)(config)
+
+class PendingSearch(NamedTuple):
+    query: str
+    future: Future
+    deadline: float  # time.monotonic() after which the answer goes on without it
+
+class WebFallback:
+    """Web search as a background stage with a hard deadline and an on-disk cache.
+
+    `start` returns at once: a cached result is ready immediately, anything
+    else runs on a small pool of its own so a hung endpoint can never hold up
+    local retrievers. `collect` waits no later than `timeout` seconds after the
+    start and gives up with no results; a search that finishes late is still
+    cached for the next time the question is asked.
+    """
+
+    def __init__(self, config, cache_path):
+        settings = config.get('web') or {}
+        self.provider = open_web_provider(config)
+        self.timeout = settings.get('timeout', 5.0)
+        self.speculate_below = settings.get('speculate_below', 0.5) if settings.get('speculative', False) else None
+        ttl = settings.get('cache_ttl', 86400)
+        self.cache = ResultCache(cache_path, max_entries=settings.get('cache_max_entries', 1000), ttl=ttl) if ttl else None
+        self._pool = ThreadPoolExecutor(max_workers=settings.get('workers', 2), thread_name_prefix="web")
+
+    def _key(self, query: str) -> str:
+        return f"{self.provider.name}|{normalize_query(query)}"
+
+    def start(self, query: str) -> PendingSearch:
+        deadline = time.monotonic() + self.timeout
+        cached = self.cache.get("web", self._key(query), version="0") if self.cache else None
+        if cached is not None:
+            future = Future()
+            future.set_result([doc_from_dict(d) for d in cached])
+            return PendingSearch(query, future, deadline)
+        return PendingSearch(query, self._pool.submit(propagate(self._search), query), deadline)
+
+    def _search(self, query: str) -> List[Document]:
+        with span("retrieve.web", provider=self.provider.name) as timing:
+            docs = self.provider.search(query)
+            timing["docs"] = len(docs)
+        if self.cache and docs:
+            self.cache.put("web", self._key(query), "0", [doc_to_dict(d) for d in docs])
+        return docs
+
+    def collect(self, pending: PendingSearch) -> List[Document]:
+        log_step("⚠️ Local context missing. Using web search...")
+        # Only the time the answer actually waits; the search itself is the retrieve.web span
+        with span("retrieve.web_wait", ready=pending.future.done()) as timing:
+            try:
+                docs = pending.future.result(timeout=max(0.0, pending.deadline - time.monotonic()))
+            except FutureTimeout:
+                pending.future.cancel()
+                logger.warning(f"Web search gave no results within {self.timeout}s; answering without it.")
+                docs, timing["timeout"] = [], True
+            except Exception as e:
+                logger.error(f"Web search failed: {e}")
+                docs = []
+            timing["docs"] = len(docs)
+        return docs
+
+    def cancel(self, pending: Optional[PendingSearch]):
+        """Drop a speculative search the local results made unnecessary."""
+        if pending is not None:
+            # One already running can't be interrupted; it finishes in the background and is cached
+            pending.future.cancel()
+            log_brain("Local notes sufficed; dropped the speculative web search.")
@@ -2,11 +2,14 @@ import streamlit as st
 import ollama
 import shutil
 import os
+import datetime
 from pathlib import Path
 from core.config_loader import ConfigLoader
 from core.ollama_client import OllamaClient
-from core.database import DatabaseManager
-from core.retrieval_engine import RetrievalEngine
+from core.shards import ShardSet, configured_shards
+from core.brain import Brain
+from core.filters import QueryFilter
+from utils.tracing import capture
 
 # --- Page Config ---
 st.set_page_config(
@@ -32,6 +35,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- Helper functions ---
+@st.cache_data(ttl=60, show_spinner=False)
 def get_ollama_models():
     try:
         models_info = ollama.list()
@@ -39,11 +43,90 @@ def get_ollama_models():
     except Exception as e:
         return ["llama3:latest", "nomic-embed-text:latest"]
 
+@st.cache_data(ttl=60, show_spinner=False)
+def get_scope_options(db_paths):
+    """Folders and tags present in the indexes of the given shards, for the scope pickers."""
+    from core.lexical_index import LexicalIndex
+    folders, tags = set(), set()
+    for db_path in db_paths:
+        try:
+            shard_folders, shard_tags = LexicalIndex(Path(db_path) / "lexical_index.sqlite").facets()
+        except Exception:
+            continue
+        folders.update(shard_folders)
+        tags.update(shard_tags)
+    return sorted(folders), sorted(tags)
+
+@st.cache_resource(show_spinner="Loading brain...")
+def load_brain(vault_path, llm_model, embed_model, top_k, strategy, web_fallback, use_crag):
+    """One shared backend per configuration, reused by every session and message."""
+    cfg = ConfigLoader()
+    cfg.config['system']['vault_path'] = vault_path
+    cfg.config['system']['llm_model'] = llm_model
+    cfg.config['system']['embed_model'] = embed_model
+    cfg.config['retrieval']['strategy'] = strategy
+    cfg.config['retrieval']['top_k'] = top_k
+    cfg.config['retrieval']['web_fallback'] = web_fallback
+    cfg.config.setdefault('features', {})['use_crag'] = use_crag
+    return Brain(cfg)
+
+def invalidate_brains():
+    """Drop cached backends so the next message reopens the freshly written index."""
+    load_brain.clear()
+    get_scope_options.clear()
+    try:
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+    except ImportError:
+        pass
+
 def reset_vector_db(db_path):
+    invalidate_brains()
     if os.path.exists(db_path):
         shutil.rmtree(db_path)
     os.makedirs(db_path, exist_ok=True)
 
+def render_sources(docs, key_prefix):
+    with st.expander(f"📚 Context ({len(docs)} chunks)", expanded=False):
+        for i, doc in enumerate(docs):
+            source = doc.metadata.get('filename', 'Unknown')
+            file_path = doc.metadata.get('source', None)
+            
+            with st.container(border=True):
+                col_text, col_btn = st.columns([0.85, 0.15])
+                with col_text:
+                    st.markdown(f"**{i+1}. {source}**")
+                    st.caption(doc.page_content[:200].replace("\n", " ") + "...")
+                
+                with col_btn:
+                    # Unique key is essential for buttons in loops
+                    if file_path and st.button("📖", key=f"{key_prefix}_{i}", help="Read full document"):
+                        view_full_document(file_path)
+
+def render_timings(spans):
+    """Where the time of one question went, stage by stage (nested stages indented)."""
+    if not spans:
+        return
+    parents = {s["span"]: s["parent"] for s in spans}
+
+    def depth(span_id):
+        level = 0
+        while parents.get(span_id) in parents:
+            span_id, level = parents[span_id], level + 1
+        return level
+
+    total = sum(s["ms"] for s in spans if s["parent"] not in parents)
+    with st.expander(f"⏱️ Timings ({total:.0f} ms)", expanded=False):
+        rows = []
+        for s in sorted(spans, key=lambda s: s["start"]):
+            details = {k: v for k, v in s.items() if k not in ("trace", "span", "parent", "name", "start", "ms")}
+            rows.append({
+                "stage": "\u2003" * depth(s["span"]) + s["name"],
+                "ms": s["ms"],
+                "details": ", ".join(f"{k}={v}" for k, v in details.items()),
+            })
+        st.dataframe(rows, hide_index=True, width="stretch")
+
 @st.dialog("📖 Full Document Viewer")
 def view_full_document(file_path):
     """Opens a modal dialog showing the full markdown content."""
@@ -59,8 +142,6 @@ def view_full_document(file_path):
 # --- Session State Initialization ---
 if "messages" not in st.session_state:
     st.session_state.messages = []
-if "last_retrieved_docs" not in st.session_state:
-    st.session_state.last_retrieved_docs = []
 
 # --- Sidebar ---
 with st.sidebar:
@@ -114,7 +195,7 @@ with st.sidebar:
 
     col1, col2 = st.columns(2)
     with col1:
-        if st.button("🔄 Update Index", type="primary", help="Scans for new/modified files and adds them to the DB. Does NOT delete existing data."):
+        if st.button("🔄 Update Index", type="primary", help="Re-indexes new/changed files and removes chunks of deleted or edited notes."):
             with st.spinner("Updating..."):
                 try:
                     cfg = ConfigLoader()
@@ -123,7 +204,8 @@ with st.sidebar:
                     cfg.config['system']['chunk_overlap'] = chunk_overlap
                     cfg.config['system']['embed_model'] = embed_model
                     client = OllamaClient(cfg)
-                    DatabaseManager(cfg, client).index_vault()
+                    ShardSet(cfg, client).index()
+                    invalidate_brains()
                     st.success("Updated!")
                 except Exception as e: st.error(f"{e}")
 
@@ -140,7 +222,8 @@ with st.sidebar:
                 cfg.config['system']['vault_path'] = vault_path_input
                 cfg.config['system']['chunk_size'] = chunk_size
                 cfg.config['system']['embed_model'] = embed_model
-                DatabaseManager(cfg, OllamaClient(cfg)).index_vault()
+                ShardSet(cfg, OllamaClient(cfg)).index()
+                invalidate_brains()
                 st.success("Rebuilt!")
                 st.session_state['confirm_reset'] = False
         if st.button("❌ Cancel"): st.session_state['confirm_reset'] = False
@@ -151,9 +234,9 @@ with st.sidebar:
     st.subheader("🔍 Retrieval Strategy")
     strategy = st.selectbox(
         "Method", 
-        ["hybrid", "hyde", "vector"], 
+        ["hybrid", "hyde", "multi_query", "vector"], 
         index=0,
-        help="• Hybrid: Searches Keywords (BM25) AND Meaning (Vector).\n• HyDE: Hallucinates an answer first, then finds matching notes.\n• Vector: Standard semantic search."
+        help="• Hybrid: Searches Keywords (BM25) AND Meaning (Vector).\n• HyDE: Hallucinates an answer first, then finds matching notes.\n• Multi-Query: Rewrites the question several ways and searches them all at once.\n• Vector: Standard semantic search."
     )
     
     top_k = st.slider(
@@ -166,51 +249,55 @@ with st.sidebar:
         web_fallback = st.toggle(
             "Web Search", 
             value=True,
-            help="If enabled, searches DuckDuckGo when no local notes are found."
+            help="If enabled, searches the web (web.provider, DuckDuckGo by default) when no local notes are found."
         )
     with c2: 
         use_crag = st.toggle(
             "CRAG", 
             value=False,
-            help="(Experimental) Corrective RAG: Evaluates retrieved documents and discards irrelevant ones."
+            help="Corrective RAG: grades retrieved chunks and drops irrelevant ones; only borderline chunks cost an LLM call."
         )
 
+    st.divider()
+
+    # 4. Scope
+    st.subheader("🎯 Scope")
+    shard_names = [s.name for s in configured_shards(default_cfg)]
+    vaults = None
+    if len(shard_names) > 1:
+        vaults = st.multiselect(
+            "Vaults", shard_names,
+            help="Vaults (shards) to search, all at once. Empty = every vault."
+        ) or None
+    scope_folders, scope_tags = get_scope_options(
+        tuple(s.persist_directory for s in configured_shards(default_cfg) if not vaults or s.name in vaults)
+    )
+    folders = st.multiselect(
+        "Folders", scope_folders,
+        help="Only search notes in these folders (subfolders included). Empty = whole vault."
+    )
+    tags = st.multiselect(
+        "Tags", scope_tags,
+        help="Only search notes carrying any of these tags (frontmatter or inline; nested tags included)."
+    )
+    modified = st.selectbox(
+        "Modified", ["Any time", "Last 7 days", "Last 30 days", "Last 12 months", "This year"],
+        help="Only search notes whose content changed in this period."
+    )
+    since = {"Last 7 days": "7d", "Last 30 days": "30d", "Last 12 months": "1y",
+             "This year": str(datetime.date.today().year)}.get(modified)
+    where = QueryFilter.build(folders, tags, since)
+
 # --- Main App ---
 st.title("🧠 Obsidian Brain")
 
-# Init Backend
-cfg = ConfigLoader()
-cfg.config['system']['vault_path'] = vault_path_input
-cfg.config['system']['llm_model'] = llm_model
-cfg.config['system']['embed_model'] = embed_model
-cfg.config['retrieval']['strategy'] = strategy
-cfg.config['retrieval']['top_k'] = top_k
-cfg.config['retrieval']['web_fallback'] = web_fallback
-
 # Show History
-for message in st.session_state.messages:
+for idx, message in enumerate(st.session_state.messages):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
-
-# --- PERSISTENT SOURCE VIEWER ---
-# We check session state specifically to keep the expander open/available
-# regardless of whether the user just hit enter or clicked a button.
-if st.session_state.last_retrieved_docs:
-    with st.expander(f"📚 Context from last query ({len(st.session_state.last_retrieved_docs)} chunks)", expanded=False):
-        for i, doc in enumerate(st.session_state.last_retrieved_docs):
-            source = doc.metadata.get('filename', 'Unknown')
-            file_path = doc.metadata.get('source', None)
-            
-            with st.container(border=True):
-                col_text, col_btn = st.columns([0.85, 0.15])
-                with col_text:
-                    st.markdown(f"**{i+1}. {source}**")
-                    st.caption(doc.page_content[:200].replace("\n", " ") + "...")
-                
-                with col_btn:
-                    # Unique key is essential for buttons in loops
-                    if file_path and st.button("📖", key=f"btn_{i}", help="Read full document"):
-                        view_full_document(file_path)
+        if message.get("sources"):
+            render_sources(message["sources"], key_prefix=f"src_{idx}")
+        render_timings(message.get("timings"))
 
 # --- Chat Input ---
 if prompt := st.chat_input("Ask your second brain..."):
@@ -218,23 +305,18 @@ if prompt := st.chat_input("Ask your second brain..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
+    with capture() as spans, st.chat_message("assistant"):
         full_response = ""
         docs = []
         
         # 1. Retrieval
         with st.status("Thinking...", expanded=True) as status:
             try:
-                client = OllamaClient(cfg)
-                db = DatabaseManager(cfg, client)
-                engine = RetrievalEngine(cfg, db, client)
-                
-                st.write(f"🔍 Searching via **{strategy}**...")
-                docs = engine.execute_retrieval(prompt)
+                brain = load_brain(vault_path_input, llm_model, embed_model, top_k, strategy, web_fallback, use_crag)
                 
-                # SAVE DOCS TO SESSION STATE (The Fix!)
-                st.session_state.last_retrieved_docs = docs
+                scope = f" in notes {where.describe()}" if where.active else ""
+                st.write(f"🔍 Searching via **{strategy}**{scope}...")
+                docs = brain.retrieve(prompt, where=where, vaults=vaults)
                 
                 if docs: status.update(label="Context Retrieved!", state="complete", expanded=False)
                 else: status.update(label="No local documents found.", state="error", expanded=False)
@@ -242,23 +324,19 @@ if prompt := st.chat_input("Ask your second brain..."):
                 st.error(f"Error: {e}")
                 st.stop()
         
-        # 2. Rerun to show the Source Expander immediately
-        # (Optional: feels snappier if sources appear before text generation finishes)
+        # 2. Sources appear as soon as retrieval finishes, before generation starts
+        if docs:
+            render_sources(docs, key_prefix=f"src_{len(st.session_state.messages)}")
         
         # 3. Generation
-        context_text = "\n\n".join([d.page_content for d in docs])
-        final_prompt = f"Answer strictly using this Context:\n{context_text}\n\nQuestion: {prompt}"
-        
+        message_placeholder = st.empty()
         try:
-            stream = client.get_llm().stream(final_prompt)
-            for chunk in stream:
-                if chunk.content:
-                    full_response += chunk.content
-                    message_placeholder.markdown(full_response + "▌")
+            for token in brain.stream_answer(prompt, docs):
+                full_response += token
+                message_placeholder.markdown(full_response + "▌")
             message_placeholder.markdown(full_response)
         except Exception as e:
             st.error(f"Generation failed: {e}")
+        render_timings(spans)
 
-    st.session_state.messages.append({"role": "assistant", "content": full_response})
-    # Force a rerun so the "Persistent Source Viewer" at the top updates with the new docs
-    st.rerun()
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": full_response, "sources": docs, "timings": spans})
@@ -1,50 +1,215 @@
+import threading
 import click
 from rich.console import Console
-from rich.panel import Panel
-from rich.markdown import Markdown
 from core.config_loader import ConfigLoader
-from core.ollama_client import OllamaClient
-from core.database import DatabaseManager
-from core.retrieval_engine import RetrievalEngine
 from utils.logger import log_step
+from utils.tracing import tracer
+
+# Models, Chroma and LangChain are imported inside the commands that use them,
+# so `--help`, `ask` against a running server and no-op reindexes start fast.
 
 console = Console()
 
+def load_config() -> ConfigLoader:
+    """config.yaml, read once per invocation and shared by the group and its command."""
+    root = click.get_current_context().find_root()
+    if root.obj is None:
+        root.obj = ConfigLoader()
+    return root.obj
+
 @click.group()
-def cli():
+@click.option('--profile', is_flag=True, help='Print per-stage timings and write a JSON-lines trace')
+@click.pass_context
+def cli(ctx, profile):
     """Obsidian-Brain: Local RAG System"""
-    pass
+    try:
+        settings = load_config().get('metrics')
+    except FileNotFoundError:
+        settings = {}  # `--help` works anywhere; commands that need the config still report it missing
+    trace_path = settings.get('trace_path') or ('trace.jsonl' if profile else None)
+    tracer.configure(trace_path=trace_path, profile=profile)
+    if profile:
+        log_step(f"Profiling; trace in {trace_path}")
+
+    def finish():
+        if settings.get('metrics_path'):
+            tracer.write_metrics(settings['metrics_path'])
+        if profile:
+            print_profile()
+    ctx.call_on_close(finish)
+
+def print_profile():
+    from rich.table import Table
+    table = Table(title="⏱ Time per stage")
+    for column in ("stage", "calls", "total ms", "max ms", "counts"):
+        table.add_column(column, justify="left" if column in ("stage", "counts") else "right")
+    for row in tracer.summary():
+        counts = ", ".join(f"{k}={v:g}" for k, v in row.items() if k not in ("span", "count", "seconds", "max_seconds"))
+        table.add_row(row["span"], str(row["count"]), f"{row['seconds'] * 1000:.1f}", f"{row['max_seconds'] * 1000:.1f}", counts)
+    console.print(table)
+
+@cli.command()
+@click.option('--vault', 'vaults', multiple=True, help='Only index this configured vault (repeatable)')
+def index(vaults):
+    """Index the Obsidian Vault (every configured vault, in parallel)."""
+    from core.ollama_client import OllamaClient
+    from core.shards import ShardSet
+    cfg = load_config()
+    shards = ShardSet(cfg, OllamaClient(cfg))
+    try:
+        shards.select(vaults)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    shards.index(vaults)
+
+def make_watchers(cfg, shards, debounce=None, poll=False):
+    """One watcher per vault shard."""
+    from core.watcher import VaultWatcher
+    settings = cfg.get('watch')
+    return [VaultWatcher(
+        db,
+        debounce=debounce if debounce is not None else settings.get('debounce', 2.0),
+        max_delay=settings.get('max_delay', 30.0),
+        poll=poll or settings.get('poll', False),
+        poll_interval=settings.get('poll_interval', 10.0)
+    ) for db in shards]
 
 @cli.command()
-def index():
-    """Index the Obsidian Vault."""
-    cfg = ConfigLoader()
-    db = DatabaseManager(cfg, OllamaClient(cfg))
-    db.index_vault()
+@click.option('--debounce', type=float, default=None, help='Quiet seconds before reindexing a burst of edits')
+@click.option('--poll', is_flag=True, help='Poll for changes (for filesystems without change notification)')
+def watch(debounce, poll):
+    """Keep the index fresh by reindexing notes as they change."""
+    from core.ollama_client import OllamaClient
+    from core.shards import ShardSet
+    cfg = load_config()
+    watchers = make_watchers(cfg, ShardSet(cfg, OllamaClient(cfg)), debounce, poll)
+    threads = [threading.Thread(target=w.run, daemon=True) for w in watchers[1:]]
+    for thread in threads:
+        thread.start()
+    try:
+        watchers[0].run()
+    except KeyboardInterrupt:
+        for watcher in watchers:
+            watcher.stop()
+        log_step("Stopped watching.")
+
+@cli.command()
+@click.option('--host', default=None, help='Interface to bind (default from config)')
+@click.option('--port', type=int, default=None, help='Port to listen on (default from config)')
+@click.option('--watch', 'with_watch', is_flag=True, help='Also reindex notes as they change')
+def serve(host, port, with_watch):
+    """Keep the brain loaded and answer over a local HTTP API."""
+    from core.server import serve as run_server
+    from core.brain import Brain
+    cfg = load_config()
+    settings = cfg.get('server')
+    brain = Brain(cfg)
+    if with_watch:
+        # Watching in-process keeps a single writer and the served indexes current
+        for watcher in make_watchers(cfg, brain.shards):
+            threading.Thread(target=watcher.run, daemon=True).start()
+    try:
+        run_server(brain, host or settings.get('host', '127.0.0.1'), port or settings.get('port', 8765))
+    except KeyboardInterrupt:
+        log_step("Server stopped.")
 
 @cli.command()
 @click.argument('query')
 @click.option('--strategy', default=None, help='Override retrieval strategy')
-def ask(query, strategy):
+@click.option('--no-server', is_flag=True, help='Do not use a running `serve` instance')
+@click.option('--folder', 'folders', multiple=True, help='Only notes under this vault folder (repeatable)')
+@click.option('--tag', 'tags', multiple=True, help='Only notes with this tag, nested tags included (repeatable)')
+@click.option('--since', default=None, help='Only notes modified since YYYY[-MM[-DD]] or e.g. 30d')
+@click.option('--until', default=None, help='Only notes modified before YYYY[-MM[-DD]] or e.g. 30d')
+@click.option('--vault', 'vaults', multiple=True, help='Only search this configured vault (repeatable; default all)')
+def ask(query, strategy, no_server, folders, tags, since, until, vaults):
     """Ask a question to your brain."""
-    cfg = ConfigLoader()
-    if strategy: cfg.config['retrieval']['strategy'] = strategy
+    from core.filters import QueryFilter
+    try:
+        where = QueryFilter.build(folders, tags, since, until)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    cfg = load_config()
+    if vaults:
+        # Checked here too, so a running server's rejection doesn't surface as a traceback
+        from core.shards import check_vaults, configured_shards
+        try:
+            check_vaults(vaults, [shard.name for shard in configured_shards(cfg)])
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    log_step(f"Query: [bold cyan]{query}[/bold cyan]")
 
-    ollama = OllamaClient(cfg)
-    engine = RetrievalEngine(cfg, DatabaseManager(cfg, ollama), ollama)
+    client = None
+    if not no_server and cfg.get('server', 'use_for_ask', True):
+        from core.server import BrainClient
+        settings = cfg.get('server')
+        client = BrainClient(f"http://{settings.get('host', '127.0.0.1')}:{settings.get('port', 8765)}")
+        if not client.available():
+            client = None
 
-    log_step(f"Query: [bold cyan]{query}[/bold cyan]")
-    docs = engine.execute_retrieval(query)
+    if client:
+        log_step("Using running brain server.")
+        try:
+            docs, tokens = client.ask(query, strategy=strategy, where=where, vaults=list(vaults) or None)
+        except ValueError as e:
+            raise click.ClickException(f"The brain server rejected the question: {e}")
+    else:
+        from core.brain import Brain
+        brain = Brain(cfg)
+        docs = brain.retrieve(query, strategy=strategy, where=where, vaults=vaults)
+        tokens = None
     
-    context = "\n\n".join([d.page_content for d in docs])
     sources = list(set([d.metadata.get('filename', 'Unknown') for d in docs]))
     log_step(f"Retrieved {len(docs)} docs from: {sources}")
 
     log_step("Generating answer...")
-    prompt = f"Answer strictly using this Context:\n{context}\n\nQuestion: {query}"
-    response = ollama.get_llm().invoke(prompt)
+    answer = "".join(tokens if tokens is not None else brain.stream_answer(query, docs))
     
-    console.print(Panel(Markdown(response.content), title="Obsidian-Brain Answer", border_style="green"))
+    from rich.markdown import Markdown
+    from rich.panel import Panel
+    console.print(Panel(Markdown(answer), title="Obsidian-Brain Answer", border_style="green"))
+
+@cli.command('ask-batch')
+@click.argument('input_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('output_path', type=click.Path(dir_okay=False))
+@click.option('--strategy', default=None, help='Retrieval strategy for questions that do not set one')
+@click.option('--concurrency', type=int, default=None, help='Ollama requests in flight at once (generation, embeddings, HyDE, rewrites, grading)')
+@click.option('--retrieval-workers', type=int, default=None, help='Questions retrieved at once, ahead of generation')
+@click.option('--prefetch', type=int, default=None, help='Retrieved questions allowed to wait for a generation slot')
+@click.option('--resume', is_flag=True, help='Keep answers already in OUTPUT_PATH and ask only the rest')
+@click.option('--summary', 'summary_path', default=None, help='Also write the throughput/latency summary here as JSON')
+def ask_batch(input_path, output_path, strategy, concurrency, retrieval_workers, prefetch, resume, summary_path):
+    """Answer every question in a JSONL file, writing answers, sources and timings as JSONL."""
+    import json
+    from pathlib import Path
+    from core.brain import Brain
+    from core.batch import BatchRunner, read_questions
+    if Path(output_path).exists() and Path(output_path).stat().st_size and not resume:
+        raise click.UsageError(f"{output_path} already has answers; pass --resume to continue it or remove it first.")
+    cfg = load_config()
+    settings = cfg.get('batch') or {}
+    brain = Brain(cfg)
+    runner = BatchRunner(
+        brain,
+        concurrency=concurrency or settings.get('concurrency', 2),
+        retrieval_workers=retrieval_workers or settings.get('retrieval_workers', 2),
+        prefetch=prefetch if prefetch is not None else settings.get('prefetch', 4),
+        strategy=strategy,
+    )
+    summary = runner.run(read_questions(input_path, brain), output_path, resume=resume)
+    if summary_path:
+        Path(summary_path).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+    from rich.table import Table
+    table = Table(title=f"{summary['answered']} answered, {summary['failed']} failed, {summary['skipped']} skipped in "
+                        f"{summary['wall_seconds']:.1f}s ({summary['questions_per_second']:.2f} q/s, "
+                        f"{summary['tokens_per_second']:.0f} tokens/s)")
+    for column in ("stage", "n", "p50 ms", "p95 ms", "p99 ms", "mean ms"):
+        table.add_column(column, justify="left" if column == "stage" else "right")
+    for stage, stats in summary["latency"].items():
+        if stats["n"]:
+            table.add_row(stage, str(stats["n"]), *(f"{stats[k]:.1f}" for k in ("p50_ms", "p95_ms", "p99_ms", "mean_ms")))
+    console.print(table)
 
 if __name__ == "__main__":
     cli()
\ No newline at end of file
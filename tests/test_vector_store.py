@@ -0,0 +1,42 @@
+from typing import Tuple
+import numpy as np
+from core.vector_store import NumpyVectorStore
+
+def make_store(directory, rows: int = 1200, dim: int = 16) -> Tuple[NumpyVectorStore, np.ndarray]:
+    store = NumpyVectorStore(directory, embedding_function=None)
+    vectors = np.random.default_rng(0).normal(size=(rows, dim)).astype(np.float32)
+    ids = [f"c{i}" for i in range(rows)]
+    store.upsert(ids, vectors, [f"doc {i}" for i in range(rows)], [{"source": f"n{i}.md"} for i in range(rows)])
+    return store, vectors
+
+def test_compaction_during_search_returns_the_right_chunk(tmp_path):
+    store, vectors = make_store(tmp_path)
+    score, deleted = store._score, []
+
+    def score_then_compact(snapshot, rows, query):
+        scores = score(snapshot, rows, query)
+        if not deleted:
+            # Deleting over compact_ratio of the rows renumbers the rest mid-search
+            deleted.extend(f"c{i}" for i in range(500))
+            store.delete(deleted)
+        return scores
+
+    store._score = score_then_compact
+    results = store.search_by_vector(vectors[600], k=3)
+    assert store._meta("generation") == 1
+    assert results[0][0].id == "c600"
+    assert results[0][0].page_content == "doc 600"
+    assert all(int(doc.id[1:]) >= 500 for doc, _ in results)
+
+def test_search_skips_chunks_deleted_after_scoring(tmp_path):
+    store, vectors = make_store(tmp_path, rows=100)
+    score = store._score
+
+    def score_then_delete(snapshot, rows, query):
+        scores = score(snapshot, rows, query)
+        store.delete(["c7"])
+        return scores
+
+    store._score = score_then_delete
+    ids = [doc.id for doc, _ in store.search_by_vector(vectors[7], k=3)]
+    assert ids and None not in ids and "c7" not in ids
@@ -0,0 +1,25 @@
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+def open_database(path, mmap_size: int = 256 * 1024 * 1024) -> sqlite3.Connection:
+    """Open a SQLite file tuned for a single writer and many concurrent readers."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # Pages are mapped lazily, so opening a large index costs nothing until it is searched
+    conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    return conn
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """Run a block of statements atomically on an autocommit connection."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
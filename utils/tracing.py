@@ -0,0 +1,146 @@
+import contextvars
+import itertools
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from utils.logger import console
+
+# (trace id, parent span id, collector) of whatever is running in this context
+_context = contextvars.ContextVar("trace_context", default=(None, None, None))
+_span_ids = itertools.count(1)
+
+class Tracer:
+    """Collects timing spans: aggregated into metrics, optionally streamed to a JSONL trace.
+
+    A span is a named stage with a duration plus any counts and sizes the stage
+    reports (chunks, bytes, tokens...). Every span updates the running totals
+    exported by `metrics_text()`; with a trace file configured each one is also
+    written as a JSON line, and with `profile` on it is echoed to the console.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals: Dict[str, Dict[str, float]] = {}
+        self.profile = False
+        self._trace = None
+
+    def configure(self, trace_path: Optional[str] = None, profile: bool = False):
+        with self._lock:
+            if self._trace:
+                self._trace.close()
+            self._trace = open(Path(trace_path).expanduser(), "a", encoding="utf-8", buffering=1) if trace_path else None
+            self.profile = profile
+
+    def emit(self, name: str, seconds: float, start: float = None, attrs: Dict = None, span_id: int = None):
+        attrs = attrs or {}
+        trace_id, parent, collector = _context.get()
+        event = {
+            "trace": trace_id, "span": span_id or next(_span_ids), "parent": parent, "name": name,
+            "start": round(start if start is not None else time.time() - seconds, 6),
+            "ms": round(seconds * 1000, 3), **attrs,
+        }
+        with self._lock:
+            totals = self.totals.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            for key, value in attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+            if self._trace:
+                self._trace.write(json.dumps(event, default=str) + "\n")
+        if collector is not None:
+            collector.append(event)
+        if self.profile:
+            details = " ".join(f"{k}={v}" for k, v in attrs.items())
+            console.print(f"[dim]⏱ {name} {seconds * 1000:.1f}ms {details}[/dim]")
+
+    def metrics_text(self) -> str:
+        """Prometheus text exposition of the span totals."""
+        with self._lock:
+            totals = {name: dict(values) for name, values in self.totals.items()}
+        lines = []
+        series: Dict[str, List[str]] = {}
+        for name, values in sorted(totals.items()):
+            for key, value in values.items():
+                metric = {"count": "span_count", "seconds": "span_seconds_total",
+                          "max_seconds": "span_seconds_max"}.get(key, f"span_{key}_total")
+                series.setdefault(metric, []).append(f'obsidian_brain_{metric}{{span="{name}"}} {value}')
+        for metric, samples in series.items():
+            kind = "gauge" if metric == "span_seconds_max" else "counter"
+            lines.append(f"# TYPE obsidian_brain_{metric} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, path):
+        path = Path(path).expanduser()
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(self.metrics_text(), encoding="utf-8")
+        tmp.replace(path)
+
+    def summary(self) -> List[Dict]:
+        with self._lock:
+            return [{"span": name, **values} for name, values in sorted(
+                self.totals.items(), key=lambda item: item[1]["seconds"], reverse=True)]
+
+tracer = Tracer()
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict]:
+    """Time a stage. Yields the attribute dict so the stage can add counts as it learns them."""
+    span_id = next(_span_ids)
+    trace_id, _, collector = _context.get()
+    token = _context.set((trace_id, span_id, collector))
+    start, t0 = time.time(), time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        try:
+            _context.reset(token)
+        except ValueError:
+            pass  # A generator holding the span was closed from another context
+        tracer.emit(name, time.perf_counter() - t0, start, attrs, span_id)
+
+def record(name: str, seconds: float, **attrs):
+    """Report a stage that was timed elsewhere."""
+    tracer.emit(name, seconds, attrs=attrs)
+
+def timed_iter(name: str, iterable: Iterable, **attrs) -> Iterator:
+    """Yield from `iterable`, reporting the time spent producing items (not consuming them)."""
+    iterator, busy, count = iter(iterable), 0.0, 0
+    start = time.time()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                busy += time.perf_counter() - t0
+                return
+            busy += time.perf_counter() - t0
+            count += 1
+            yield item
+    finally:
+        tracer.emit(name, busy, start, {"items": count, **attrs})
+
+@contextmanager
+def capture() -> Iterator[List[Dict]]:
+    """Collect every span finished inside the block (including in `propagate`d threads) under one trace id."""
+    spans: List[Dict] = []
+    token = _context.set((uuid.uuid4().hex[:16], None, spans))
+    try:
+        yield spans
+    finally:
+        _context.reset(token)
+
+def propagate(fn: Callable) -> Callable:
+    """Bind `fn` to the current trace so spans it opens on a pool thread nest correctly."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)